@@ -0,0 +1,119 @@
+# app/admission.py
+import math
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+
+from app.metrics import metrics
+from app.mlx_service import get_mlx_service
+
+
+class Ticket:
+    """An admitted unit of model work; release it exactly once when the work ends"""
+
+    def __init__(self, controller: "AdmissionController", kind: str):
+        self.controller = controller
+        self.kind = kind
+        self.started = time.perf_counter()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """Bounds how much model work (VLM turns, TTS) is admitted at once.
+
+    Past `max_pending` admitted jobs a request is turned away at once with
+    429 and a Retry-After estimated from recent job times, instead of piling
+    up behind the inference scheduler. While the models aren't usable it
+    answers 503.
+    """
+
+    def __init__(self, max_pending: int = 8, concurrency: int = 1, ready: Optional[Callable[[], bool]] = None):
+        self.max_pending = max_pending
+        self.concurrency = max(1, concurrency)
+        self.ready = ready
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._job_s = 2.0  # running average, seeded with a typical webcam turn
+        self.admitted = 0
+        self.rejected = 0
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return sum(self._pending.values())
+
+    def retry_after(self, pending: Optional[int] = None) -> int:
+        pending = self.pending if pending is None else pending
+        return max(1, min(30, math.ceil(self._job_s * (pending + 1) / self.concurrency)))
+
+    def acquire(self, kind: str) -> Ticket:
+        """Admit one job or raise HTTPException(429/503) with Retry-After"""
+        if self.ready is not None and not self.ready():
+            metrics.incr("admission_unavailable")
+            raise HTTPException(status_code=503, detail="Models are not loaded",
+                                headers={"Retry-After": "10"})
+        with self._lock:
+            pending = sum(self._pending.values())
+            if pending >= self.max_pending:
+                self.rejected += 1
+                full = True
+            else:
+                self._pending[kind] += 1
+                self.admitted += 1
+                full = False
+        if full:
+            metrics.incr("admission_rejected")
+            raise HTTPException(status_code=429, detail=f"Server busy: {pending} requests pending",
+                                headers={"Retry-After": str(self.retry_after(pending))})
+        metrics.observe("admission_pending", pending + 1)
+        return Ticket(self, kind)
+
+    def _release(self, ticket: Ticket):
+        elapsed = time.perf_counter() - ticket.started
+        with self._lock:
+            self._pending[ticket.kind] -= 1
+            self._job_s = 0.8 * self._job_s + 0.2 * elapsed
+
+    @asynccontextmanager
+    async def admit(self, kind: str):
+        ticket = self.acquire(kind)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            by_kind = {kind: n for kind, n in self._pending.items() if n}
+            return {
+                "pending": sum(by_kind.values()),
+                "pending_by_kind": by_kind,
+                "max_pending": self.max_pending,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "avg_job_s": round(self._job_s, 2)
+            }
+
+
+admission = None
+
+
+def get_admission() -> AdmissionController:
+    global admission
+    if admission is None:
+        admission = AdmissionController(
+            max_pending=int(os.getenv("MAX_PENDING_REQUESTS", "8")),
+            concurrency=int(os.getenv("MAX_BATCH_SIZE", "4")),
+            ready=lambda: get_mlx_service().vlm_model is not None
+        )
+    return admission
@@ -0,0 +1,108 @@
+# app/audio_transport.py
+import io
+import threading
+import time
+import uuid
+import wave
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Wire formats for /api/chat/audio/clips/{id}: name -> media type (PCM16 gets its rate appended)
+AUDIO_FORMATS = {
+    "pcm16": "audio/L16",
+    "wav": "audio/wav",
+    "flac": "audio/flac",
+    "ogg": "audio/ogg",
+    "opus": "audio/ogg; codecs=opus",
+}
+# libsndfile container/subtype per compressed format
+_SOUNDFILE_FORMATS = {"flac": ("FLAC", "PCM_16"), "ogg": ("OGG", "VORBIS"), "opus": ("OGG", "OPUS")}
+
+
+def negotiate_format(requested: Optional[str], accept: Optional[str] = None, default: str = "wav") -> str:
+    """Audio format from an explicit name, else the first supported media type in an Accept header"""
+    if requested:
+        requested = requested.lower()
+        if requested not in AUDIO_FORMATS:
+            raise ValueError(f"Unsupported audio format '{requested}' (expected one of {', '.join(AUDIO_FORMATS)})")
+        return requested
+    for part in (accept or "").split(","):
+        media = part.split(";")[0].strip().lower()
+        for name, media_type in AUDIO_FORMATS.items():
+            if media == media_type.split(";")[0]:
+                return name
+    return default
+
+
+def clip_url(audio_id: str, fmt: str) -> str:
+    return f"/api/chat/audio/clips/{audio_id}?format={fmt}"
+
+
+def encode_audio(wav_bytes: bytes, fmt: str) -> Tuple[bytes, str]:
+    """(body, media type) for a PCM16 WAV clip re-encoded as `fmt`"""
+    if fmt == "wav":
+        return wav_bytes, AUDIO_FORMATS["wav"]
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wav:
+        sample_rate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+    if fmt == "pcm16":
+        # RFC 2586 L16 is big-endian
+        pcm = np.frombuffer(frames, dtype="<i2").astype(">i2")
+        return pcm.tobytes(), f"{AUDIO_FORMATS['pcm16']}; rate={sample_rate}; channels=1"
+
+    import soundfile as sf
+    container, subtype = _SOUNDFILE_FORMATS[fmt]
+    if subtype not in sf.available_subtypes(container):
+        raise ValueError(f"Audio format '{fmt}' is not supported by this libsndfile build")
+    samples = np.frombuffer(frames, dtype="<i2")
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, sample_rate, format=container, subtype=subtype)
+    return buffer.getvalue(), AUDIO_FORMATS[fmt]
+
+
+class AudioStore:
+    """Recently synthesized clips by id, fetched over the binary audio endpoint.
+
+    Text streams carry only the id; the clip itself goes out as raw bytes in
+    whichever format the client asks for. Clips expire after `ttl` seconds,
+    or oldest-first past `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._clips: "OrderedDict[str, Tuple[bytes, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+
+    def put(self, wav_bytes: bytes, duration: float) -> str:
+        audio_id = uuid.uuid4().hex[:16]
+        with self._lock:
+            self._expire()
+            self._clips[audio_id] = (wav_bytes, duration, time.time())
+            self.nbytes += len(wav_bytes)
+            while self.nbytes > self.max_bytes and len(self._clips) > 1:
+                _, (evicted, _, _) = self._clips.popitem(last=False)
+                self.nbytes -= len(evicted)
+        return audio_id
+
+    def get(self, audio_id: str) -> Optional[Tuple[bytes, float]]:
+        with self._lock:
+            self._expire()
+            clip = self._clips.get(audio_id)
+            return (clip[0], clip[1]) if clip else None
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        while self._clips:
+            audio_id, (audio, _, created) = next(iter(self._clips.items()))
+            if created >= cutoff:
+                break
+            del self._clips[audio_id]
+            self.nbytes -= len(audio)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"clips": len(self._clips), "bytes": self.nbytes, "max_bytes": self.max_bytes}
@@ -0,0 +1,571 @@
+# app/camera_manager.py
+import os
+import threading
+import concurrent.futures
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.frame_recorder import FrameRecorder
+from app.frame_sources import FrameSource, create_source, parse_source_spec, source_spec_for
+
+
+# Role -> candidate device indices, first available wins.
+# Override with e.g. CAMERA_ROLES="ai=1|0,wrist=1,top=0"
+DEFAULT_CAMERA_ROLES = "ai=1|0,wrist=1,top=0"
+
+
+def parse_camera_roles(spec: str) -> Dict[str, List[int]]:
+    roles = {}
+    for entry in spec.split(","):
+        if "=" not in entry:
+            continue
+        role, indices = entry.split("=", 1)
+        try:
+            roles[role.strip()] = [int(i) for i in indices.split("|") if i.strip()]
+        except ValueError:
+            print(f"⚠️ Ignoring invalid camera role entry: {entry!r}")
+    return roles
+
+
+class RateMeter:
+    """Events per second over a short sliding window"""
+
+    def __init__(self, window: float = 2.0):
+        self.window = window
+        self._events = deque()
+        self._lock = threading.Lock()
+
+    def mark(self):
+        now = time.monotonic()
+        with self._lock:
+            self._events.append(now)
+            self._trim(now)
+
+    def rate(self) -> float:
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            return len(self._events) / self.window
+
+    def _trim(self, now: float):
+        while self._events and now - self._events[0] > self.window:
+            self._events.popleft()
+
+
+@dataclass
+class Frame:
+    """A captured frame. `image` is BGR and shared between consumers - never modify it in place."""
+    seq: int
+    timestamp: float
+    image: np.ndarray
+    camera: int = -1
+
+
+class JpegCache:
+    """Encode-once cache of JPEG variants keyed by (seq, quality, width).
+
+    Only the variants of the last few frames are kept; older entries are
+    dropped as new frames arrive.
+    """
+
+    def __init__(self, keep_frames: int = 4):
+        self.keep_frames = keep_frames
+        self._entries: Dict[Tuple[int, int, int], bytes] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.encodes = 0
+
+    def get(self, frame: Frame, quality: int = 80, width: Optional[int] = None) -> bytes:
+        src_width = frame.image.shape[1]
+        if not width or width >= src_width:
+            width = src_width
+        key = (frame.seq, quality, width)
+
+        # Held during the encode so concurrent subscribers wait for the
+        # first encoder instead of doing the same work again
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self.hits += 1
+                return data
+
+            image = frame.image
+            if width != src_width:
+                height = max(1, round(image.shape[0] * width / src_width))
+                image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+            _, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            data = buffer.tobytes()
+            self.encodes += 1
+
+            self._entries[key] = data
+            oldest = frame.seq - self.keep_frames
+            for stale in [k for k in self._entries if k[0] <= oldest]:
+                del self._entries[stale]
+            return data
+
+
+class FrameSubscriber:
+    """Bounded per-consumer queue fed by the grabber thread.
+
+    When the consumer falls behind the oldest frame is dropped, so a slow
+    client always gets the newest frame instead of a growing backlog. Those
+    drops are this consumer's own; the device itself captured the frame.
+    """
+
+    def __init__(self, stream: "CameraStream", maxsize: int = 1, name: str = "subscriber"):
+        self._stream = stream
+        self.name = name
+        self._queue = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def push(self, frame: Frame):
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append(frame)
+            self._cond.notify()
+
+    def get(self, timeout: float = 1.0) -> Optional[Frame]:
+        """Next queued frame, or None on timeout / close"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._queue or self.closed, timeout=timeout)
+            if self._queue:
+                self._stream.delivered.mark()
+                return self._queue.popleft()
+            return None
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+        self._stream.unsubscribe(self)
+
+
+class CameraStream:
+    """Owns one capture device and runs a single grabber thread for it.
+
+    Consumers never call `read()` themselves: they take the latest frame or
+    wait for a newer sequence number, so every viewer sees the full frame rate.
+    """
+
+    def __init__(self, index: int, width: int = 1280, height: int = 720, fps: int = 30, buffer_size: int = 8,
+                 source: Optional[FrameSource] = None):
+        self.index = index
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+        # Physical device by default; CAMERA_SOURCE_<index> swaps in a synthetic source
+        self.source = source or create_source(index, width, height, fps)
+        self._thread = None
+        self._running = False
+        self._cond = threading.Condition()
+        self._buffer = deque(maxlen=buffer_size)
+        self._latest: Optional[Frame] = None
+        self._seq = 0
+        self.jpeg_cache = JpegCache()
+        self._subscribers = set()
+        self.recorder: Optional[FrameRecorder] = None
+
+        # Stats
+        self.captured = RateMeter()
+        self.delivered = RateMeter()
+        self.frames_captured = 0
+        self.read_failures = 0
+
+    def start(self) -> bool:
+        """Open the source and start the grabber thread"""
+        if not self.source.open():
+            return False
+
+        self.width = self.source.width
+        self.height = self.source.height
+        self.fps = self.source.fps
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"camera-{self.index}", daemon=True)
+        self._thread.start()
+        return True
+
+    def _run(self):
+        failures = 0
+        while self._running:
+            ret, image = self.source.read()
+            if not ret:
+                failures += 1
+                self.read_failures += 1
+                if failures == 1:
+                    print(f"⚠️ Camera {self.index} read failed, retrying")
+                time.sleep(min(0.05 * failures, 1.0))
+                continue
+            failures = 0
+            self.frames_captured += 1
+            self.captured.mark()
+
+            with self._cond:
+                self._seq += 1
+                frame = Frame(seq=self._seq, timestamp=time.time(), image=image, camera=self.index)
+                self._latest = frame
+                self._buffer.append(frame)
+                self._cond.notify_all()
+                subscribers = list(self._subscribers)
+
+            for subscriber in subscribers:
+                subscriber.push(frame)
+
+    def is_opened(self) -> bool:
+        return self._running and self.source.is_opened()
+
+    def latest(self) -> Optional[Frame]:
+        """Most recent frame, or None if nothing has been captured yet"""
+        if self._latest is not None:
+            self.delivered.mark()
+        return self._latest
+
+    def wait_for_frame(self, after_seq: int = 0, timeout: float = 1.0) -> Optional[Frame]:
+        """Block until a frame with seq > after_seq is available"""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: not self._running or (self._latest is not None and self._latest.seq > after_seq),
+                timeout=timeout
+            )
+            if self._latest is not None and self._latest.seq > after_seq:
+                self.delivered.mark()
+                return self._latest
+            return None
+
+    def subscribe(self, maxsize: int = 1, name: str = "subscriber") -> FrameSubscriber:
+        """Register a consumer that receives every new frame through its own bounded queue"""
+        subscriber = FrameSubscriber(self, maxsize, name)
+        with self._cond:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: FrameSubscriber):
+        with self._cond:
+            self._subscribers.discard(subscriber)
+
+    def subscriber_count(self) -> int:
+        with self._cond:
+            return len(self._subscribers)
+
+    def subscriber_drops(self) -> List[dict]:
+        """Frames each consumer missed because its queue was full - not capture losses"""
+        with self._cond:
+            subscribers = list(self._subscribers)
+        return [{"name": s.name, "dropped": s.dropped} for s in subscribers]
+
+    def get_frame(self, newer_than: Optional[float] = None, timeout: float = 1.0) -> Optional[Frame]:
+        """Latest frame captured after `newer_than` (epoch seconds), or simply the latest.
+
+        Returns at once when the buffer already holds such a frame and only
+        waits on the grabber otherwise - no device reads on the caller's thread.
+        """
+        def fresh(frame: Optional[Frame]) -> bool:
+            return frame is not None and (newer_than is None or frame.timestamp > newer_than)
+
+        frame = self._latest
+        if not fresh(frame):
+            with self._cond:
+                self._cond.wait_for(lambda: not self._running or fresh(self._latest), timeout=timeout)
+                frame = self._latest
+            if not fresh(frame):
+                return None
+
+        self.delivered.mark()
+        return frame
+
+    def has_frame_newer_than(self, newer_than: float) -> bool:
+        frame = self._latest
+        return frame is not None and frame.timestamp > newer_than
+
+    def encode_jpeg(self, frame: Frame, quality: int = 80, width: Optional[int] = None) -> bytes:
+        """JPEG bytes for a frame, encoded at most once per (quality, width) variant"""
+        return self.jpeg_cache.get(frame, quality, width)
+
+    def recent_frames(self) -> List[Frame]:
+        """Snapshot of the ring buffer, oldest first"""
+        with self._cond:
+            return list(self._buffer)
+
+    def start_recording(self, path: str, slot_count: int = 300, fmt: str = "jpeg", quality: int = 80,
+                        keep: int = 3):
+        """Record this stream into a memory-mapped ring file, keeping `keep` earlier recordings"""
+        if self.recorder is None:
+            self.recorder = FrameRecorder(self, path, slot_count, fmt, quality, keep)
+            print(f"⏺️ Recording camera {self.index} to {path}")
+
+    def stats(self) -> dict:
+        return {
+            "index": self.index,
+            "source": self.source.kind,
+            "available": self.is_opened(),
+            "width": self.width,
+            "height": self.height,
+            "configured_fps": self.fps,
+            "capture_fps": round(self.captured.rate(), 1),
+            "delivered_fps": round(self.delivered.rate(), 1),
+            "frames_captured": self.frames_captured,
+            "read_failures": self.read_failures,
+            "subscribers": self.subscriber_count(),
+            "subscriber_drops": self.subscriber_drops(),
+            "jpeg_encodes": self.jpeg_cache.encodes,
+            "jpeg_cache_hits": self.jpeg_cache.hits,
+            "recorder": self.recorder.stats() if self.recorder else None
+        }
+
+    def stop(self):
+        if self.recorder:
+            self.recorder.stop()
+            self.recorder = None
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.close()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self.source.release()
+
+
+class CameraManager:
+    """Registry of running camera streams, one per device index.
+
+    Both the AI path and the video endpoints take their streams from here,
+    so each physical device is opened exactly once.
+    """
+
+    def __init__(self, roles: Optional[Dict[str, List[int]]] = None):
+        self._streams: Dict[int, CameraStream] = {}
+        self._lock = threading.Lock()
+        # One opener per device; opening happens outside _lock so status calls never wait on hardware
+        self._opening: Dict[int, threading.Lock] = {}
+        self.roles = roles if roles is not None else parse_camera_roles(
+            os.getenv("CAMERA_ROLES", DEFAULT_CAMERA_ROLES)
+        )
+
+        # Device inventory, probed once and refreshed in the background
+        self.probe_count = int(os.getenv("CAMERA_PROBE_COUNT", "4"))
+        self._inventory: Dict[int, dict] = {}
+        self.inventory_updated = 0.0
+        self._refresh_thread = None
+        self._refresh_stop = threading.Event()
+
+        # Waits on several grabbers at once for synchronized captures
+        self._capture_pool = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="camera-sync")
+
+    def get(self, index: int) -> Optional[CameraStream]:
+        """Get the running stream for a device, starting it on first use"""
+        with self._lock:
+            stream = self._streams.get(index)
+            if stream and stream.is_opened():
+                return stream
+            opening = self._opening.setdefault(index, threading.Lock())
+
+        with opening:
+            with self._lock:
+                stream = self._streams.get(index)
+                if stream and stream.is_opened():
+                    return stream
+                stale = self._streams.pop(index, None)
+            if stale:
+                stale.stop()
+
+            stream = CameraStream(index)
+            if not stream.start():
+                print(f" Camera {index} not available")
+                return None
+            print(f" Camera {index} initialized ({stream.width}x{stream.height} @ {stream.fps}fps)")
+
+            record_dir = os.getenv("FRAME_RECORD_DIR")
+            if record_dir:
+                stream.start_recording(
+                    os.path.join(record_dir, f"camera_{index}.ring"),
+                    slot_count=int(os.getenv("FRAME_RECORD_SLOTS", "300")),
+                    fmt=os.getenv("FRAME_RECORD_FORMAT", "jpeg"),
+                    quality=int(os.getenv("FRAME_RECORD_QUALITY", "80")),
+                    keep=int(os.getenv("FRAME_RECORD_KEEP", "3"))
+                )
+
+            with self._lock:
+                self._streams[index] = stream
+            return stream
+
+    def get_role(self, role: str) -> Optional[CameraStream]:
+        """Get the stream for a configured role ("ai", "wrist", "top", ...)"""
+        for index in self.roles.get(role, []):
+            stream = self.get(index)
+            if stream:
+                return stream
+        return None
+
+    def roles_for(self, index: int) -> List[str]:
+        """Roles currently served by a device - the first active candidate of each role"""
+        active = self.active()
+        roles = []
+        for role, indices in self.roles.items():
+            serving = next((i for i in indices if i in active and active[i].is_opened()), None)
+            if serving == index:
+                roles.append(role)
+        return roles
+
+    def stats(self) -> dict:
+        stats = {}
+        for index, stream in self.active().items():
+            stream_stats = stream.stats()
+            stream_stats["roles"] = self.roles_for(index)
+            stats[f"camera_{index}"] = stream_stats
+        return stats
+
+    def _probe(self, index: int, active: Dict[int, CameraStream]) -> dict:
+        """Describe one device. Live streams (from the `active` snapshot) are reported as-is and never reopened."""
+        stream = active.get(index)
+        if stream and stream.is_opened():
+            return {
+                "index": index,
+                "available": True,
+                "active": True,
+                "width": stream.width,
+                "height": stream.height,
+                "fps": stream.fps
+            }
+
+        if source_spec_for(index):
+            # Synthetic sources are cheap to describe and touch no hardware
+            try:
+                source = parse_source_spec(source_spec_for(index), index)
+            except ValueError as e:
+                print(f"⚠️ {e}")
+                return {"index": index, "available": False, "active": False}
+            info = source.describe()
+            info.update(index=index, available=True, active=False)
+            return info
+
+        cap = cv2.VideoCapture(index)
+        try:
+            if not cap.isOpened():
+                return {"index": index, "available": False, "active": False}
+            return {
+                "index": index,
+                "available": True,
+                "active": False,
+                "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                "fps": int(cap.get(cv2.CAP_PROP_FPS))
+            }
+        finally:
+            cap.release()
+
+    def refresh_inventory(self) -> Dict[int, dict]:
+        """Re-probe all device indices (slow - call off the event loop)"""
+        # Probing can block for seconds per device, so get() must not wait on it
+        active = self.active()
+        inventory = {i: self._probe(i, active) for i in range(self.probe_count)}
+        with self._lock:
+            self._inventory = inventory
+            self.inventory_updated = time.time()
+        available = [i for i, info in inventory.items() if info["available"]]
+        print(f"📷 Camera inventory refreshed: {available}")
+        return inventory
+
+    def inventory(self) -> Dict[int, dict]:
+        """Cached device inventory; live streams report their current state"""
+        inventory = {}
+        active = self.active()
+        for index, info in self._inventory.items():
+            info = dict(info)
+            stream = active.get(index)
+            if stream and stream.is_opened():
+                info.update(available=True, active=True, width=stream.width, height=stream.height, fps=stream.fps)
+            else:
+                info["active"] = False
+            info["roles"] = self.roles_for(index)
+            inventory[index] = info
+        return inventory
+
+    def start_inventory_refresh(self, interval: float):
+        """Probe once now, then keep the inventory fresh for hot-plugged devices"""
+        self.refresh_inventory()
+        if interval <= 0 or self._refresh_thread:
+            return
+
+        def run():
+            while not self._refresh_stop.wait(interval):
+                try:
+                    self.refresh_inventory()
+                except Exception as e:
+                    print(f"⚠️ Camera inventory refresh failed: {e}")
+
+        self._refresh_stop.clear()
+        self._refresh_thread = threading.Thread(target=run, name="camera-inventory", daemon=True)
+        self._refresh_thread.start()
+
+    def capture_synchronized(self, roles: List[str], newer_than: Optional[float] = None,
+                             timeout: float = 1.0) -> Dict[str, Frame]:
+        """Grab one frame per role with matched timestamps.
+
+        All cameras are waited on in parallel, so latency is bounded by the
+        slowest one. Each camera then contributes the buffered frame closest to
+        the oldest of the newest frames, which keeps the set within about one
+        frame interval of each other. Roles without a camera or a fresh frame
+        are left out of the result.
+        """
+        streams = {}
+        for role in roles:
+            stream = self.get_role(role)
+            if stream:
+                streams[role] = stream
+        if not streams:
+            return {}
+
+        futures = {
+            role: self._capture_pool.submit(stream.get_frame, newer_than, timeout)
+            for role, stream in streams.items()
+        }
+        newest = {}
+        for role, future in futures.items():
+            frame = future.result()
+            if frame is not None:
+                newest[role] = frame
+        if len(newest) < 2:
+            return newest
+
+        target = min(frame.timestamp for frame in newest.values())
+        matched = {}
+        for role, frame in newest.items():
+            candidates = [f for f in streams[role].recent_frames() if newer_than is None or f.timestamp > newer_than]
+            matched[role] = min(candidates or [frame], key=lambda f: abs(f.timestamp - target))
+        return matched
+
+    def active(self) -> Dict[int, CameraStream]:
+        with self._lock:
+            return dict(self._streams)
+
+    def shutdown(self):
+        self._capture_pool.shutdown(wait=False)
+        self._refresh_stop.set()
+        self._refresh_thread = None
+        with self._lock:
+            for index, stream in self._streams.items():
+                stream.stop()
+                print(f"🧹 Camera {index} released")
+            self._streams.clear()
+
+
+# Global manager
+camera_manager = None
+
+def get_camera_manager() -> CameraManager:
+    global camera_manager
+    if camera_manager is None:
+        camera_manager = CameraManager()
+    return camera_manager
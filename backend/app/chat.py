@@ -1,6 +1,8 @@
 # app/chat.py - FIXED VERSION
 from fastapi import APIRouter, Request, UploadFile, File, Form, HTTPException
 from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 from typing import Optional, List
 import json
 import asyncio
@@ -12,9 +14,32 @@ import time
 import uuid
 from app.vercel import VercelStreamResponse
 from app.mlx_service import get_mlx_service
+from app.admission import get_admission
+from app.audio_transport import encode_audio, negotiate_format
+from app.tts_engine import is_kokoro_voice
+from app.metrics import metrics
+from app.model_registry import ModelBudgetError
+from app.inference_scheduler import PRIORITY_INTERACTIVE
+from app.streaming import disconnect_watch
 
 router = APIRouter(prefix="/chat")
 
+# Bytes per write when streaming a binary audio clip
+AUDIO_CHUNK_SIZE = 16 * 1024
+# Utterances accepted by one /tts/batch request
+MAX_TTS_BATCH = 64
+# Fastest Kokoro speed multiplier a /tts/batch item may ask for
+MAX_TTS_SPEED = 3.0
+
+def parse_audio_format(requested: Optional[str]) -> Optional[str]:
+    """Validated audio_format request field (None keeps base64 WAV inline)"""
+    if not requested:
+        return None
+    try:
+        return negotiate_format(requested)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/")
 async def chat(request: Request) -> StreamingResponse:
     """Original chat endpoint with MLX integration"""
@@ -23,66 +48,81 @@ async def chat(request: Request) -> StreamingResponse:
     last_message = messages[-1] if messages else {"content": ""}
     
     user_prompt = last_message.get("content", "")
+    stop_policy = data.get("stop_policy")
+    # Sessions are opt-in: the AI SDK's own "id" comes with every request and would pin a KV cache per chat.
+    # Earlier messages reseed a session the server has dropped.
+    session_id = data.get("session_id")
+    # Per-request A/B switch for draft-model decoding (omitted: server default)
+    speculative = data.get("speculative")
+    # Binary audio: the stream references clips by id instead of inlining base64 WAV
+    audio_format = parse_audio_format(data.get("audio_format"))
     
     # Get MLX service
     mlx_service = get_mlx_service()
+    # Turned away with 429/503 here, before the stream starts
+    ticket = get_admission().acquire("chat")
     
-    # Process with webcam + MLX
-    try:
-        result = await mlx_service.webcam_chat(user_prompt, enable_tts=True, max_tokens=50)
-        ai_response = result.get("ai_response", "No response generated")
-        
-        # Create streaming events
-        events = []
-        
+    def text_event(content: str) -> str:
+        return f"data: {json.dumps({'type': 'text', 'content': content})}\n\n"
+    
+    async def event_stream():
         # Add query context
-        events.append(f'User query: "{user_prompt}"\n\n')
+        yield text_event(f'User query: "{user_prompt}"\n\n')
         
-        # Stream AI response word by word
-        response_tokens = ai_response.split(' ')
-        events.extend([f"{token} " for token in response_tokens])
-        
-        # Add audio annotation if available
-        if result.get("audio") and result["audio"].get("success"):
-            audio_annotation = {
-                "type": "audio_response",
+        # Process with webcam + MLX, forwarding tokens as they are decoded
+        try:
+            result = {}
+            streamed = False
+            async with disconnect_watch(request) as gone:
+                events = mlx_service.webcam_chat_stream(user_prompt, max_tokens=50, stop_policy=stop_policy,
+                                                        priority=PRIORITY_INTERACTIVE, abort=gone,
+                                                        session_id=session_id, history=messages[:-1],
+                                                        speculative=speculative)
+                # Each sentence is spoken while the next one decodes
+                async for event in mlx_service.speak_chat_stream(events, "am_michael", abort=gone,
+                                                                 audio_format=audio_format):
+                    if event["type"] == "token":
+                        streamed = True
+                        yield text_event(event["text"])
+                    elif event["type"] == "frames":
+                        result["has_webcam"] = True
+                    elif event["type"] == "done":
+                        result.update(event)
+                        if not streamed:
+                            yield text_event(event["ai_response"] or "No response generated")
+                        yield f"data: {json.dumps({'type': 'metrics', 'data': event['metrics']})}\n\n"
+                    elif event["type"] == "audio":
+                        # Inline "audio_data", or "audio_id"/"audio_url" with an audio_format
+                        audio = {k: v for k, v in event.items() if k != "type"}
+                        audio_annotation = {"type": "audio_response", "data": {**audio, "voice": "am_michael"}}
+                        yield f"data: {json.dumps(audio_annotation)}\n\n"
+                    elif event["type"] == "error":
+                        raise RuntimeError(event["error"])
+            if gone.is_set():
+                return
+            if "ai_response" not in result:
+                yield text_event("No response generated")
+            
+            # Add webcam annotation
+            webcam_annotation = {
+                "type": "webcam_capture",
                 "data": {
-                    "audio_data": result["audio"]["audio_data"],
-                    "text": ai_response,
-                    "voice": "am_michael",
-                    "duration": result["audio"].get("duration", 0)
+                    "captured": result.get("has_webcam", False),
+                    "timestamp": asyncio.get_event_loop().time()
                 }
             }
-            events.append(audio_annotation)
-        
-        # Add webcam annotation
-        webcam_annotation = {
-            "type": "webcam_capture",
-            "data": {
-                "captured": result.get("has_webcam", False),
-                "timestamp": asyncio.get_event_loop().time()
-            }
-        }
-        events.append(webcam_annotation)
-        
-    except Exception as e:
-        print(f" MLX processing error: {e}")
-        # Fallback to original sample response
-        events = [
-            f'User query: "{user_prompt}"\n\n',
-            f"Sorry, I encountered an error: {str(e)}\n\n",
-            "Please try again or check the MLX service status."
-        ]
-    
-    async def event_stream():
-        for event in events:
-            await asyncio.sleep(0.05)
-            if isinstance(event, str):
-                yield f"data: {json.dumps({'type': 'text', 'content': event})}\n\n"
-            elif isinstance(event, dict):
-                yield f"data: {json.dumps(event)}\n\n"
+            yield f"data: {json.dumps(webcam_annotation)}\n\n"
+            
+        except Exception as e:
+            print(f" MLX processing error: {e}")
+            yield text_event(f"Sorry, I encountered an error: {str(e)}\n\n")
+            yield text_event("Please try again or check the MLX service status.")
+        finally:
+            ticket.release()
 
-    return StreamingResponse(event_stream(), media_type="text/event-stream")
+    # The background release covers a client that leaves before the stream starts
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             background=BackgroundTask(ticket.release))
 
 # Add this simple test endpoint to your app/chat.py
 
@@ -399,48 +439,55 @@ async def test_endpoint(request: Request):
 
 @router.post("/realtime")
 async def realtime_chat(request: Request) -> StreamingResponse:
-    """Use the audio we already generated!"""
+    """Stream tokens as the VLM decodes them, with an AUDIO: line per sentence as soon as it is spoken"""
     data = await request.json()
     messages = data.get("messages", [])
     prompt = messages[-1]["content"] if messages else "hello"
+    stop_policy = data.get("stop_policy")
+    session_id = data.get("session_id")
+    speculative = data.get("speculative")
+    audio_format = parse_audio_format(data.get("audio_format"))
     
     print(f"🎯 Request: {prompt}")
     
     mlx_service = get_mlx_service()
+    ticket = get_admission().acquire("realtime")
     
     async def ai_sdk_stream():
         try:
-            # Get response from MLX (which INCLUDES audio!)
-            result = await mlx_service.webcam_chat(prompt, enable_tts=True, max_tokens=50)
-            
-            if "error" in result:
-                yield f'0:"Error: {result["error"]}"\n'
-                return
-            
-            response_text = result.get("ai_response", "No response")
-            print(f" Response: {response_text}")
-            
-            # Stream text first
-            words = response_text.split()
-            for word in words:
-                chunk = f'0:"{word} "\n'
-                yield chunk
-                await asyncio.sleep(0.1)
-            
-            yield f'0:""\n'  # End text
-            
-            # NOW SEND THE AUDIO THAT'S ALREADY GENERATED!
-            if result.get("audio") and result["audio"].get("success"):
-                audio_b64 = result["audio"]["audio_data"]
-                
-                # Send audio command that frontend can catch
-                audio_cmd = f'AUDIO:{audio_b64}\n'
-                yield audio_cmd
-                print(f"🔊 Sent audio: {len(audio_b64)} chars")
+            streamed = False
+            async with disconnect_watch(request) as gone:
+                events = mlx_service.webcam_chat_stream(prompt, max_tokens=50, stop_policy=stop_policy,
+                                                        priority=PRIORITY_INTERACTIVE, abort=gone,
+                                                        session_id=session_id, history=messages[:-1],
+                                                        speculative=speculative)
+                async for event in mlx_service.speak_chat_stream(events, "am_michael", abort=gone,
+                                                                 audio_format=audio_format):
+                    if event["type"] == "token":
+                        streamed = True
+                        yield f'0:{json.dumps(event["text"])}\n'
+                    elif event["type"] == "done":
+                        response_text = event["ai_response"]
+                        print(f" Response: {response_text} (TTFT {event['metrics'].get('ttft_ms')}ms)")
+                        if not streamed and response_text:
+                            yield f'0:{json.dumps(response_text)}\n'
+                        yield f'0:""\n'  # End text
+                    elif event["type"] == "audio" and audio_format:
+                        # Only the reference goes in the text stream; the client fetches the bytes
+                        yield f'AUDIO_URL:{event["audio_url"]}\n'
+                    elif event["type"] == "audio":
+                        # Send audio command that frontend can catch
+                        yield f'AUDIO:{event["audio_data"]}\n'
+                        print(f"🔊 Sent audio chunk {event['chunk_index']}: {len(event['audio_data'])} chars")
+                    elif event["type"] == "error":
+                        yield f'0:{json.dumps("Error: " + event["error"])}\n'
+                        return
                 
         except Exception as e:
             print(f" Error: {e}")
-            yield f'0:"Error: {str(e)}"\n'
+            yield f'0:{json.dumps("Error: " + str(e))}\n'
+        finally:
+            ticket.release()
     
     return StreamingResponse(
         ai_sdk_stream(),
@@ -448,23 +495,32 @@ async def realtime_chat(request: Request) -> StreamingResponse:
         headers={
             "Cache-Control": "no-cache",
             "Access-Control-Allow-Origin": "*",
-        }
+        },
+        background=BackgroundTask(ticket.release)
     )
 
 @router.post("/webcam")
 async def webcam_chat(
     prompt: str = Form(...),
     max_tokens: int = Form(50),
-    enable_tts: bool = Form(True)
+    enable_tts: bool = Form(True),
+    cameras: Optional[str] = Form(None),
+    stop_policy: Optional[str] = Form(None),
+    session_id: Optional[str] = Form(None),
+    speculative: Optional[bool] = Form(None)
 ) -> dict:
-    """Direct webcam chat endpoint"""
+    """Direct webcam chat endpoint - `cameras` is a comma separated list of roles, e.g. wrist,top.
+    Requests sharing a `session_id` continue one conversation."""
     mlx_service = get_mlx_service()
+    camera_roles = [c.strip() for c in cameras.split(",") if c.strip()] if cameras else None
     
-    try:
-        result = await mlx_service.webcam_chat(prompt, enable_tts, max_tokens)
-        return result
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    async with get_admission().admit("webcam"):
+        try:
+            result = await mlx_service.webcam_chat(prompt, enable_tts, max_tokens, camera_roles, stop_policy,
+                                                   session_id=session_id, speculative=speculative)
+            return result
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/image")
 async def image_chat(
@@ -476,29 +532,30 @@ async def image_chat(
     """Chat with uploaded image"""
     mlx_service = get_mlx_service()
     
-    try:
-        # Read and process uploaded image
-        image_data = await image.read()
-        pil_image = Image.open(BytesIO(image_data))
-        
-        # Process with MLX-VLM
-        ai_response = mlx_service.process_image_chat(pil_image, prompt, max_tokens)
-        
-        result = {
-            "ai_response": ai_response,
-            "prompt": prompt,
-            "image_filename": image.filename
-        }
-        
-        # Generate TTS if enabled
-        if enable_tts and ai_response and not ai_response.startswith("Error"):
-            tts_result = mlx_service._generate_tts(ai_response, "am_michael")
-            result["audio"] = tts_result
-        
-        return result
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    async with get_admission().admit("image"):
+        try:
+            # Read and process uploaded image
+            image_data = await image.read()
+            pil_image = Image.open(BytesIO(image_data))
+            
+            # Process with MLX-VLM, off the event loop
+            ai_response = await run_in_threadpool(mlx_service.process_image_chat, pil_image, prompt, max_tokens)
+            
+            result = {
+                "ai_response": ai_response,
+                "prompt": prompt,
+                "image_filename": image.filename
+            }
+            
+            # Generate TTS if enabled
+            if enable_tts and ai_response and not ai_response.startswith("Error"):
+                tts_result = await mlx_service.async_generate_tts(ai_response, "am_michael")
+                result["audio"] = tts_result
+            
+            return result
+            
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/audio")
 async def audio_chat(
@@ -510,39 +567,40 @@ async def audio_chat(
     """Chat with uploaded audio files"""
     mlx_service = get_mlx_service()
     
-    try:
-        # Save uploaded audio files temporarily
-        audio_paths = []
-        for audio_file in audio_files:
-            temp_path = f"temp_{audio_file.filename}"
-            with open(temp_path, "wb") as f:
-                content = await audio_file.read()
-                f.write(content)
-            audio_paths.append(temp_path)
-        
-        # Process with MLX-VLM audio support
-        ai_response = mlx_service.process_audio_chat(audio_paths, prompt, max_tokens)
-        
-        result = {
-            "ai_response": ai_response,
-            "prompt": prompt,
-            "audio_files": [f.filename for f in audio_files]
-        }
-        
-        # Generate TTS if enabled
-        if enable_tts and ai_response and not ai_response.startswith("Error"):
-            tts_result = mlx_service._generate_tts(ai_response, "am_michael")
-            result["audio"] = tts_result
-        
-        # Cleanup temp files
-        for path in audio_paths:
-            if os.path.exists(path):
-                os.remove(path)
-        
-        return result
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    async with get_admission().admit("audio"):
+        try:
+            # Save uploaded audio files temporarily
+            audio_paths = []
+            for audio_file in audio_files:
+                temp_path = f"temp_{audio_file.filename}"
+                with open(temp_path, "wb") as f:
+                    content = await audio_file.read()
+                    f.write(content)
+                audio_paths.append(temp_path)
+            
+            # Process with MLX-VLM audio support
+            ai_response = await run_in_threadpool(mlx_service.process_audio_chat, audio_paths, prompt, max_tokens)
+            
+            result = {
+                "ai_response": ai_response,
+                "prompt": prompt,
+                "audio_files": [f.filename for f in audio_files]
+            }
+            
+            # Generate TTS if enabled
+            if enable_tts and ai_response and not ai_response.startswith("Error"):
+                tts_result = await mlx_service.async_generate_tts(ai_response, "am_michael")
+                result["audio"] = tts_result
+            
+            # Cleanup temp files
+            for path in audio_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            
+            return result
+            
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/multimodal")
 async def multimodal_chat(
@@ -555,70 +613,151 @@ async def multimodal_chat(
     """Chat with both image and audio"""
     mlx_service = get_mlx_service()
     
-    try:
-        # Process image
-        image_data = await image.read()
-        pil_image = Image.open(BytesIO(image_data))
-        
-        # Process audio files
-        audio_paths = []
-        for audio_file in audio_files:
-            temp_path = f"temp_{audio_file.filename}"
-            with open(temp_path, "wb") as f:
-                content = await audio_file.read()
-                f.write(content)
-            audio_paths.append(temp_path)
-        
-        # Process with multimodal MLX
-        ai_response = mlx_service.process_multimodal_chat(pil_image, audio_paths, prompt, max_tokens)
-        
-        result = {
-            "ai_response": ai_response,
-            "prompt": prompt,
-            "image_filename": image.filename,
-            "audio_files": [f.filename for f in audio_files]
-        }
-        
-        # Generate TTS if enabled
-        if enable_tts and ai_response and not ai_response.startswith("Error"):
-            tts_result = mlx_service._generate_tts(ai_response, "am_michael")
-            result["audio"] = tts_result
-        
-        # Cleanup
-        for path in audio_paths:
-            if os.path.exists(path):
-                os.remove(path)
-        
-        return result
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    async with get_admission().admit("multimodal"):
+        try:
+            # Process image
+            image_data = await image.read()
+            pil_image = Image.open(BytesIO(image_data))
+            
+            # Process audio files
+            audio_paths = []
+            for audio_file in audio_files:
+                temp_path = f"temp_{audio_file.filename}"
+                with open(temp_path, "wb") as f:
+                    content = await audio_file.read()
+                    f.write(content)
+                audio_paths.append(temp_path)
+            
+            # Process with multimodal MLX
+            ai_response = await run_in_threadpool(mlx_service.process_multimodal_chat, pil_image, audio_paths,
+                                                  prompt, max_tokens)
+            
+            result = {
+                "ai_response": ai_response,
+                "prompt": prompt,
+                "image_filename": image.filename,
+                "audio_files": [f.filename for f in audio_files]
+            }
+            
+            # Generate TTS if enabled
+            if enable_tts and ai_response and not ai_response.startswith("Error"):
+                tts_result = await mlx_service.async_generate_tts(ai_response, "am_michael")
+                result["audio"] = tts_result
+            
+            # Cleanup
+            for path in audio_paths:
+                if os.path.exists(path):
+                    os.remove(path)
+            
+            return result
+            
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/tts")
 async def text_to_speech(
     text: str = Form(...),
     voice: str = Form("am_michael"),
-    speed: float = Form(1.2)
+    speed: float = Form(1.2),
+    audio_format: Optional[str] = Form(None)
 ) -> dict:
-    """Generate speech from text"""
+    """Generate speech from text - with `audio_format`, a reference to the binary clip instead of base64"""
     mlx_service = get_mlx_service()
+    audio_format = parse_audio_format(audio_format)
     
-    try:
-        result = mlx_service._generate_tts(text, voice)
-        return result
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    async with get_admission().admit("tts"):
+        try:
+            return await mlx_service.async_generate_tts(text, voice, speed, audio_format)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/tts/batch")
+async def batch_text_to_speech(request: Request) -> StreamingResponse:
+    """Speak a list of {"text", "voice", "speed"} items; one NDJSON result line per item as it finishes.
+    
+    Lines carry the item's "index" and arrive cached-first, not in request order.
+    Every item is validated before anything is spoken; a bad one fails the request with 422.
+    """
+    data = await request.json()
+    items = data.get("items") or []
+    if not items or len(items) > MAX_TTS_BATCH:
+        raise HTTPException(status_code=400, detail=f"Send between 1 and {MAX_TTS_BATCH} items")
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            raise HTTPException(status_code=422, detail=f"Item {i} is not an object")
+        text = item.get("text")
+        if not isinstance(text, str) or not text.strip():
+            raise HTTPException(status_code=422, detail=f"Item {i} needs a non-empty text string")
+        speed = item.get("speed", 1.2)
+        if isinstance(speed, bool) or not isinstance(speed, (int, float)) or not 0 < speed <= MAX_TTS_SPEED:
+            raise HTTPException(status_code=422, detail=f"Item {i} speed must be a number in (0, {MAX_TTS_SPEED}]")
+        voice = item.get("voice", "am_michael")
+        if not isinstance(voice, str) or not is_kokoro_voice(voice):
+            raise HTTPException(status_code=422, detail=f"Item {i} has an unknown voice {voice!r}")
+    audio_format = parse_audio_format(data.get("audio_format"))
+    mlx_service = get_mlx_service()
+    ticket = get_admission().acquire("tts")
+    
+    async def result_stream():
+        try:
+            async with disconnect_watch(request) as gone:
+                async for result in mlx_service.batch_tts_stream(items, audio_format, abort=gone):
+                    yield json.dumps(result) + "\n"
+        finally:
+            ticket.release()
+    
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson",
+                             background=BackgroundTask(ticket.release))
 
 @router.get("/cameras")
-async def get_available_cameras():
+async def get_available_cameras(refresh: bool = False):
     """Get info about available cameras"""
     try:
         mlx_service = get_mlx_service()
-        cameras = mlx_service.get_camera_info()
+        # Answered from the cached inventory, but the first call (or refresh=true) probes every device
+        cameras = await run_in_threadpool(mlx_service.get_camera_info, refresh)
         return {"cameras": cameras}
     except Exception as e:
         return {"error": str(e), "cameras": []}
 
+@router.get("/metrics")
+async def get_metrics():
+    """Latency and throughput metrics for the inference paths"""
+    snapshot = metrics.snapshot()
+    snapshot["inference"] = get_mlx_service().inference_stats()
+    snapshot["admission"] = get_admission().stats()
+    return snapshot
+
+@router.get("/queue")
+async def get_queue():
+    """Current load: admitted model jobs and requests waiting on the inference scheduler"""
+    scheduler = get_mlx_service().scheduler
+    return {
+        "admission": get_admission().stats(),
+        "scheduler_queue_depth": scheduler.queue_depth() if scheduler else 0
+    }
+
+@router.get("/models")
+async def get_models():
+    """Active model per slot, deployment tier and resident models with their memory"""
+    return get_mlx_service().model_info()
+
+@router.post("/models/activate")
+async def activate_model(request: Request):
+    """Hot-swap the VLM: {"name": "gemma-3n-e4b"} (catalog name or Hugging Face path)"""
+    data = await request.json()
+    name = data.get("name")
+    if not name:
+        raise HTTPException(status_code=400, detail="Missing model name")
+    try:
+        return await run_in_threadpool(get_mlx_service().activate_vlm, name)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ModelBudgetError as e:
+        raise HTTPException(status_code=507, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to load {name}: {e}")
+
 @router.get("/health")
 async def health_check():
     """Check MLX service health"""
@@ -632,6 +771,29 @@ async def health_check():
     except Exception as e:
         return {"status": "error", "error": str(e)}
 
+@router.get("/audio/clips/{audio_id}")
+async def get_audio_clip(audio_id: str, request: Request, format: Optional[str] = None):
+    """A synthesized clip as raw bytes, sent chunked - pcm16, wav, flac, ogg or opus by ?format= or Accept"""
+    clip = get_mlx_service().audio_clips.get(audio_id)
+    if clip is None:
+        raise HTTPException(status_code=404, detail=f"Audio clip {audio_id} not found or expired")
+    wav_bytes, duration = clip
+    try:
+        fmt = negotiate_format(format, request.headers.get("accept"))
+        body, media_type = await run_in_threadpool(encode_audio, wav_bytes, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    
+    metrics.incr("audio_bytes_sent", len(body))
+    if duration:
+        # Wire cost per spoken second, comparable with audio_bytes_per_s_inline
+        metrics.observe(f"audio_bytes_per_s_{fmt}", len(body) / duration)
+    chunks = (body[i:i + AUDIO_CHUNK_SIZE] for i in range(0, len(body), AUDIO_CHUNK_SIZE))
+    return StreamingResponse(chunks, media_type=media_type, headers={
+        "X-Audio-Duration": f"{duration:.3f}",
+        "Cache-Control": "no-store"
+    })
+
 @router.get("/audio/{filename}")
 async def get_audio_file(filename: str):
     """Serve generated audio files"""
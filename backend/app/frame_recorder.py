@@ -0,0 +1,190 @@
+# app/frame_recorder.py
+import mmap
+import os
+import struct
+import threading
+from typing import Iterator, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+# File layout:
+#   header (64 bytes) | index (slot_count entries) | data (slot_count * slot_size, page aligned)
+# An index entry's seq is written last and zeroed before its slot is overwritten,
+# so readers never pick up a half-written frame.
+MAGIC = b"RBFRAME1"
+HEADER = struct.Struct("<8sIIIQ")        # magic, version, slot_count, format, slot_size
+HEADER_SIZE = 64
+ENTRY = struct.Struct("<QdIHHB7x")       # seq, timestamp, length, width, height, channels
+FORMAT_RAW = 0
+FORMAT_JPEG = 1
+FORMATS = {"raw": FORMAT_RAW, "jpeg": FORMAT_JPEG}
+
+
+def _data_offset(slot_count: int) -> int:
+    index_end = HEADER_SIZE + slot_count * ENTRY.size
+    return (index_end + mmap.PAGESIZE - 1) // mmap.PAGESIZE * mmap.PAGESIZE
+
+
+def rotate_recordings(path: str, keep: int):
+    """Shift `path` to `path.1`, `path.1` to `path.2`, ... keeping `keep` old recordings"""
+    if not os.path.exists(path):
+        return
+    if keep <= 0:
+        os.remove(path)
+        return
+    for n in range(keep - 1, 0, -1):
+        older = f"{path}.{n}"
+        if os.path.exists(older):
+            os.replace(older, f"{path}.{n + 1}")
+    os.replace(path, f"{path}.1")
+
+
+class FrameRingWriter:
+    """Fixed-size memory-mapped ring of frames with a timestamp index.
+
+    Every writer starts a fresh file; a recording already at `path` (say, of
+    the session that made the stream restart) is rotated to `path.1` first.
+    """
+
+    def __init__(self, path: str, slot_count: int, slot_size: int, fmt: str = "jpeg", keep: int = 3):
+        self.path = path
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+        self.format = FORMATS[fmt]
+        self._data_offset = _data_offset(slot_count)
+        self._next_slot = 0
+
+        size = self._data_offset + slot_count * slot_size
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        rotate_recordings(path, keep)
+        self._file = open(path, "w+b")
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._map[:HEADER.size] = HEADER.pack(MAGIC, 1, slot_count, self.format, slot_size)
+
+    def write(self, seq: int, timestamp: float, data, width: int, height: int, channels: int) -> bool:
+        """Store one frame; `data` is anything exposing the buffer protocol. False if it doesn't fit."""
+        view = memoryview(data).cast("B")
+        if view.nbytes > self.slot_size:
+            return False
+
+        slot = self._next_slot
+        self._next_slot = (slot + 1) % self.slot_count
+        entry_offset = HEADER_SIZE + slot * ENTRY.size
+        data_offset = self._data_offset + slot * self.slot_size
+
+        self._map[entry_offset:entry_offset + 8] = b"\0" * 8
+        self._map[data_offset:data_offset + view.nbytes] = view
+        self._map[entry_offset:entry_offset + ENTRY.size] = ENTRY.pack(
+            seq, timestamp, view.nbytes, width, height, channels
+        )
+        return True
+
+    def close(self):
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+
+class FrameRingReader:
+    """Reads a ring written by FrameRingWriter, oldest frame first"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, _version, self.slot_count, self.format, self.slot_size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a frame recording")
+        self._data_offset = _data_offset(self.slot_count)
+
+    def entries(self) -> List[Tuple[int, float, int, int, int, int, int]]:
+        """(seq, timestamp, slot, length, width, height, channels) for every stored frame, by seq"""
+        entries = []
+        for slot in range(self.slot_count):
+            seq, timestamp, length, width, height, channels = ENTRY.unpack_from(
+                self._map, HEADER_SIZE + slot * ENTRY.size
+            )
+            if seq:
+                entries.append((seq, timestamp, slot, length, width, height, channels))
+        entries.sort()
+        return entries
+
+    def decode(self, entry) -> Optional[np.ndarray]:
+        _seq, _timestamp, slot, length, width, height, channels = entry
+        offset = self._data_offset + slot * self.slot_size
+        data = np.frombuffer(self._map, dtype=np.uint8, count=length, offset=offset)
+        if self.format == FORMAT_JPEG:
+            return cv2.imdecode(data, cv2.IMREAD_COLOR)
+        return data.reshape(height, width, channels).copy()
+
+    def frames(self) -> Iterator[Tuple[int, float, np.ndarray]]:
+        for entry in self.entries():
+            image = self.decode(entry)
+            if image is not None:
+                yield entry[0], entry[1], image
+
+    def close(self):
+        self._map.close()
+
+
+class FrameRecorder:
+    """Records a camera stream into a ring file from its own thread.
+
+    It subscribes like any other consumer, so the grabber only pays for one
+    queue push; when the disk falls behind, frames are dropped, never queued.
+    """
+
+    def __init__(self, stream, path: str, slot_count: int = 300, fmt: str = "jpeg", quality: int = 80,
+                 keep: int = 3):
+        self.stream = stream
+        self.path = path
+        self.format = fmt
+        self.quality = quality
+        self.recorded = 0
+        self.skipped = 0
+
+        channels = 3
+        raw_size = stream.width * stream.height * channels
+        # JPEG slots are sized for a generous ~1/4 of the raw frame
+        slot_size = raw_size if fmt == "raw" else max(raw_size // 4, 64 * 1024)
+        self._writer = FrameRingWriter(path, slot_count, slot_size, fmt, keep)
+        self._subscriber = stream.subscribe(maxsize=8, name="recorder")
+        self._thread = threading.Thread(target=self._run, name=f"recorder-{stream.index}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._subscriber.closed:
+            frame = self._subscriber.get(timeout=1.0)
+            if frame is None:
+                continue
+
+            image = frame.image
+            if self.format == "jpeg":
+                # Shares the encode with MJPEG clients at the same quality
+                data = self.stream.encode_jpeg(frame, quality=self.quality)
+            else:
+                data = np.ascontiguousarray(image)
+
+            height, width = image.shape[:2]
+            channels = image.shape[2] if image.ndim == 3 else 1
+            if self._writer.write(frame.seq, frame.timestamp, data, width, height, channels):
+                self.recorded += 1
+            else:
+                self.skipped += 1
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "format": self.format,
+            "recorded": self.recorded,
+            "skipped": self.skipped,
+            "dropped": self._subscriber.dropped
+        }
+
+    def stop(self):
+        self._subscriber.close()
+        self._thread.join(timeout=2.0)
+        self._writer.close()
@@ -0,0 +1,347 @@
+# app/frame_sources.py
+import os
+import random
+import time
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+from app.frame_recorder import FrameRingReader
+
+
+class FrameSource:
+    """Something a CameraStream can pull BGR frames from.
+
+    `read()` blocks until the next frame is due, like a real device, and
+    returns (ok, image) the same way `cv2.VideoCapture.read()` does.
+    """
+
+    kind = "source"
+
+    def __init__(self, width: int = 1280, height: int = 720, fps: float = 30):
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+    def open(self) -> bool:
+        return True
+
+    def is_opened(self) -> bool:
+        return True
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+    def describe(self) -> dict:
+        return {"source": self.kind, "width": self.width, "height": self.height, "fps": self.fps}
+
+
+class DeviceSource(FrameSource):
+    """A physical camera through cv2.VideoCapture"""
+
+    kind = "device"
+
+    def __init__(self, index: int, width: int = 1280, height: int = 720, fps: float = 30):
+        super().__init__(width, height, fps)
+        self.index = index
+        self._capture = None
+
+    def open(self) -> bool:
+        cap = cv2.VideoCapture(self.index)
+        if not cap.isOpened():
+            cap.release()
+            return False
+
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        cap.set(cv2.CAP_PROP_FPS, self.fps)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        # Report what the driver actually gave us
+        self.width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or self.width
+        self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or self.height
+        self.fps = int(cap.get(cv2.CAP_PROP_FPS)) or self.fps
+        self._capture = cap
+        return True
+
+    def is_opened(self) -> bool:
+        return self._capture is not None and self._capture.isOpened()
+
+    def read(self):
+        return self._capture.read()
+
+    def release(self):
+        if self._capture:
+            self._capture.release()
+            self._capture = None
+
+
+class PacedSource(FrameSource):
+    """Base for synthetic sources: delivers frames on a fixed clock with optional jitter"""
+
+    def __init__(self, width: int = 1280, height: int = 720, fps: float = 30, jitter: float = 0.0,
+                 seed: Optional[int] = None):
+        super().__init__(width, height, fps)
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._next_due = None
+        self._opened = False
+        self.frame_count = 0
+
+    def open(self) -> bool:
+        self._opened = True
+        self._next_due = time.monotonic()
+        return True
+
+    def is_opened(self) -> bool:
+        return self._opened
+
+    def release(self):
+        self._opened = False
+
+    def next_image(self) -> Optional[np.ndarray]:
+        raise NotImplementedError
+
+    def read(self):
+        if not self._opened:
+            return False, None
+
+        delay = self._next_due - time.monotonic()
+        if self.jitter:
+            delay += self._random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        self._next_due = max(self._next_due + 1.0 / self.fps, time.monotonic() - 1.0 / self.fps)
+
+        image = self.next_image()
+        if image is None:
+            return False, None
+        self.frame_count += 1
+        return True, image
+
+    def fit(self, image: np.ndarray) -> np.ndarray:
+        if image.shape[1] != self.width or image.shape[0] != self.height:
+            image = cv2.resize(image, (self.width, self.height), interpolation=cv2.INTER_AREA)
+        return image
+
+    def describe(self) -> dict:
+        info = super().describe()
+        info["jitter"] = self.jitter
+        return info
+
+
+class TestPatternSource(PacedSource):
+    """Generated colour bars with a moving marker and the frame number burnt in"""
+
+    kind = "pattern"
+
+    BARS = [(255, 255, 255), (0, 255, 255), (255, 255, 0), (0, 255, 0),
+            (255, 0, 255), (0, 0, 255), (255, 0, 0), (0, 0, 0)]
+
+    def open(self) -> bool:
+        bars = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        bar_width = max(1, self.width // len(self.BARS))
+        for i, colour in enumerate(self.BARS):
+            bars[:, i * bar_width:(i + 1) * bar_width] = colour
+        self._background = bars
+        return super().open()
+
+    def next_image(self):
+        image = self._background.copy()
+        x = (self.frame_count * 8) % self.width
+        cv2.rectangle(image, (x, self.height // 3), (min(x + 40, self.width - 1), self.height // 3 + 40), (128, 128, 128), -1)
+        cv2.putText(image, f"#{self.frame_count}", (20, self.height - 30), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 0), 3)
+        return image
+
+
+class VideoFileSource(PacedSource):
+    """Plays a video file at a fixed rate, optionally looping"""
+
+    kind = "video"
+
+    def __init__(self, path: str, loop: bool = True, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.loop = loop
+        self._capture = None
+
+    def open(self) -> bool:
+        cap = cv2.VideoCapture(self.path)
+        if not cap.isOpened():
+            cap.release()
+            return False
+        self._capture = cap
+        return super().open()
+
+    def next_image(self):
+        ret, image = self._capture.read()
+        if not ret and self.loop:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, image = self._capture.read()
+        return self.fit(image) if ret else None
+
+    def release(self):
+        super().release()
+        if self._capture:
+            self._capture.release()
+            self._capture = None
+
+    def describe(self) -> dict:
+        info = super().describe()
+        info["path"] = self.path
+        return info
+
+
+class ImageDirectorySource(PacedSource):
+    """Cycles through the images of a directory in name order"""
+
+    kind = "images"
+
+    EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+    def __init__(self, path: str, loop: bool = True, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.loop = loop
+        self._files: List[str] = []
+        self._cache = {}
+
+    def open(self) -> bool:
+        if not os.path.isdir(self.path):
+            return False
+        self._files = sorted(
+            os.path.join(self.path, name) for name in os.listdir(self.path)
+            if name.lower().endswith(self.EXTENSIONS)
+        )
+        return bool(self._files) and super().open()
+
+    def next_image(self):
+        position = self.frame_count
+        if position >= len(self._files) and not self.loop:
+            return None
+        path = self._files[position % len(self._files)]
+        # Decode each file once so playback rate isn't bounded by imread
+        image = self._cache.get(path)
+        if image is None:
+            image = cv2.imread(path)
+            if image is None:
+                return None
+            image = self.fit(image)
+            self._cache[path] = image
+        return image
+
+    def describe(self) -> dict:
+        info = super().describe()
+        info["path"] = self.path
+        info["frames"] = len(self._files)
+        return info
+
+
+class RecordingSource(PacedSource):
+    """Replays a ring file written by the frame recorder, at the recorded rate unless fps is given"""
+
+    kind = "recording"
+
+    def __init__(self, path: str, loop: bool = True, fps: Optional[float] = None, **kwargs):
+        super().__init__(fps=fps or 30, **kwargs)
+        self.path = path
+        self.loop = loop
+        self._fixed_fps = fps
+        self._reader = None
+        self._entries = []
+
+    def open(self) -> bool:
+        try:
+            self._reader = FrameRingReader(self.path)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Cannot replay {self.path}: {e}")
+            return False
+        self._entries = self._reader.entries()
+        if not self._entries:
+            return False
+
+        _seq, first_ts, _slot, _length, self.width, self.height, _channels = self._entries[0]
+        last_ts = self._entries[-1][1]
+        if not self._fixed_fps and len(self._entries) > 1 and last_ts > first_ts:
+            self.fps = (len(self._entries) - 1) / (last_ts - first_ts)
+        return super().open()
+
+    def next_image(self):
+        position = self.frame_count
+        if position >= len(self._entries) and not self.loop:
+            return None
+        return self._reader.decode(self._entries[position % len(self._entries)])
+
+    def release(self):
+        super().release()
+        if self._reader:
+            self._reader.close()
+            self._reader = None
+
+    def describe(self) -> dict:
+        info = super().describe()
+        info["path"] = self.path
+        info["frames"] = len(self._entries)
+        if self._entries:
+            info["first_seq"] = self._entries[0][0]
+            info["last_seq"] = self._entries[-1][0]
+        return info
+
+
+def parse_source_spec(spec: str, index: int, width: int = 1280, height: int = 720, fps: float = 30) -> FrameSource:
+    """Build a source from a spec string.
+
+    Examples:
+        device                                   physical camera at this index
+        pattern://?size=640x480&fps=15&jitter=0.005
+        video:///path/to/bench.mp4?fps=30&loop=0
+        images:///path/to/frames?fps=5
+        recording:///path/to/camera_1.ring       replay at the recorded rate
+    """
+    parsed = urlparse(spec)
+    kind = parsed.scheme or spec
+    params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+
+    if "size" in params:
+        width, height = (int(v) for v in params["size"].lower().split("x"))
+    fps = float(params.get("fps", fps))
+
+    if kind == "device":
+        return DeviceSource(index, width, height, fps)
+
+    paced = {
+        "width": width,
+        "height": height,
+        "fps": fps,
+        "jitter": float(params.get("jitter", 0)),
+        "seed": int(params["seed"]) if "seed" in params else None
+    }
+    loop = params.get("loop", "1") not in ("0", "false", "no")
+    path = (parsed.netloc + parsed.path) if parsed.scheme else ""
+
+    if kind == "pattern":
+        return TestPatternSource(**paced)
+    if kind == "video":
+        return VideoFileSource(path, loop=loop, **paced)
+    if kind == "images":
+        return ImageDirectorySource(path, loop=loop, **paced)
+    if kind == "recording":
+        if "fps" not in params:
+            paced["fps"] = None
+        return RecordingSource(path, loop=loop, **paced)
+    raise ValueError(f"Unknown frame source '{spec}'")
+
+
+def source_spec_for(index: int) -> Optional[str]:
+    """Configured spec for a camera index - CAMERA_SOURCE_<index>, unset means a physical device"""
+    return os.getenv(f"CAMERA_SOURCE_{index}")
+
+
+def create_source(index: int, width: int = 1280, height: int = 720, fps: float = 30) -> FrameSource:
+    spec = source_spec_for(index) or "device"
+    return parse_source_spec(spec, index, width, height, fps)
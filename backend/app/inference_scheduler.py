@@ -0,0 +1,359 @@
+# app/inference_scheduler.py
+import itertools
+import queue
+import threading
+import time
+from typing import Callable, Iterator, List, Optional
+
+from PIL import Image
+
+from app.metrics import metrics
+
+_DONE = object()
+
+# Lower runs first: a live voice/chat turn goes ahead of queued uploads
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BATCH = 2
+
+
+class SchedulerClosed(RuntimeError):
+    """Raised by submit() once the scheduler has been shut down (e.g. its model was swapped out)"""
+
+
+class GenerationRequest:
+    """One VLM generation handed to the scheduler; text segments come back through `tokens()`"""
+
+    def __init__(self, prompt: str, images: List[Image.Image], max_tokens: int = 50, temperature: float = 0.7,
+                 stop: Optional[Callable[[str], bool]] = None, prefix=None, stats: Optional[dict] = None,
+                 priority: int = PRIORITY_NORMAL, abort: Optional[threading.Event] = None, session=None,
+                 speculative: bool = False):
+        self.prompt = prompt
+        self.images = images
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.stop = stop
+        self.prefix = prefix
+        self.stats = stats if stats is not None else {}
+        self.priority = priority
+        # A warm chat session brings its own KV cache, so it never joins a batch
+        self.session = session
+        self.speculative = speculative
+        # Set by the HTTP layer when the client goes away
+        self._abort = abort
+        self.submitted_at = time.perf_counter()
+        self.raw = ""
+        self.generated = 0
+        self._cancelled = threading.Event()
+        self._output = queue.Queue()
+        self.finished = False
+        # The scheduler thread serving this request, so tokens() notices if it dies
+        self._worker: Optional[threading.Thread] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set() or (self._abort is not None and self._abort.is_set())
+
+    def cancel(self):
+        """Stop generating for this request; the scheduler drops it at the next token"""
+        self._cancelled.set()
+
+    def emit(self, text: str) -> bool:
+        """Record one generated token's text; True once the request needs no more tokens"""
+        self.generated += 1
+        if text:
+            self.raw += text
+            self._output.put(text)
+        if self.stop and self.stop(self.raw):
+            self.stats["stopped_early"] = True
+            return True
+        return self.cancelled or self.generated >= self.max_tokens
+
+    def flush(self, text: str):
+        """Text released by the detokenizer after the last token"""
+        if text:
+            self.raw += text
+            self._output.put(text)
+
+    def finish(self, error: Optional[BaseException] = None):
+        if self.finished:
+            return
+        self.finished = True
+        self.stats["generated_tokens"] = self.generated
+        if self._abort is not None and self._abort.is_set():
+            self.stats["aborted"] = True
+            metrics.incr("requests_aborted")
+        self._output.put(error if error is not None else _DONE)
+
+    def tokens(self) -> Iterator[str]:
+        """Blocking iterator over generated text; re-raises a generation error"""
+        while True:
+            try:
+                item = self._output.get(timeout=1.0)
+            except queue.Empty:
+                if self._worker is not None and not self._worker.is_alive():
+                    raise SchedulerClosed("Inference scheduler stopped before the request finished")
+                continue
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+class InferenceScheduler:
+    """Owns the VLM on a single thread and batches requests that arrive close together.
+
+    Requests wait in a priority queue (PRIORITY_INTERACTIVE first, FIFO within
+    a priority); the first one taken opens a collection window of `window_ms`; every
+    request submitted before it closes (up to `max_batch`) is prefilled as one
+    left-padded batch and decoded in lockstep, each row leaving the batch at
+    its own EOS, max_tokens, stop condition or cancellation. A lone request runs through
+    the single-sequence path, which can start from the prefix cache. A warm chat
+    session always takes that path; a cold one batches and keeps its row's cache.
+    """
+
+    def __init__(self, generator, window_ms: float = 15, max_batch: int = 4, speculative=None):
+        self.generator = generator
+        # Optional SpeculativeDecoder for requests that ask for it
+        self.speculative = speculative
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._running = True
+        self._closed = False
+        self._submit_lock = threading.Lock()
+        self.batches = 0
+        self.batched_requests = 0
+        self.batch_failures = 0
+        self._thread = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit(self, request: GenerationRequest) -> GenerationRequest:
+        with self._submit_lock:
+            if self._closed:
+                raise SchedulerClosed("Inference scheduler is shut down")
+            request._worker = self._thread
+            self._queue.put((request.priority, next(self._order), request))
+        return request
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def _collect(self) -> List[GenerationRequest]:
+        _, _, first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                _, _, request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                self._running = False
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._collect()
+            if not batch:
+                break
+            try:
+                self._serve(batch)
+            except Exception as e:
+                # Anything the per-path handlers didn't catch must not take the thread down
+                print(f"⚠️ Scheduler error, failing {len(batch)} request(s): {e}")
+                metrics.incr("scheduler_errors")
+                for request in batch:
+                    request.finish(e)
+
+    def _serve(self, batch: List[GenerationRequest]):
+        for request in batch:
+            if request.cancelled:
+                # Client left while the request was queued
+                metrics.incr("requests_cancelled_queued")
+                request.finish()
+        batch = [r for r in batch if not r.cancelled]
+        if not batch:
+            return
+
+        started = time.perf_counter()
+        for request in batch:
+            request.stats["queue_ms"] = round((started - request.submitted_at) * 1000, 1)
+            request.stats["batch_size"] = len(batch)
+            metrics.observe("scheduler_queue_ms", request.stats["queue_ms"])
+        metrics.observe("batch_size", len(batch))
+
+        # Cold sessions batch like anything else and are seeded from their row afterwards
+        solo = [r for r in batch if (r.session is not None and r.session.warm) or self._speculative(r)]
+        batch = [r for r in batch if r not in solo]
+        if len(batch) == 1 or (batch and not self._fits(batch)):
+            solo += batch
+            batch = []
+        if batch:
+            self._run_batch(batch)
+        for request in solo:
+            self._run_single(request)
+
+    def _fits(self, batch: List[GenerationRequest]) -> bool:
+        # Sliding-window layers only hold `limit` positions; past that, rows would be cut differently
+        limit = self.generator.max_batch_context()
+        if not limit:
+            return True
+        # Rough bound: prompts are a few hundred tokens of text plus ~256 per image
+        longest = max(len(r.prompt) // 3 + 256 * len(r.images) + r.max_tokens for r in batch)
+        return longest < limit
+
+    def _speculative(self, request: GenerationRequest) -> bool:
+        if not (request.speculative and self.speculative):
+            return False
+        if request.session is not None and request.session.warm:
+            # Continuing a session's own cache stays on the plain path; cold sessions are seeded either way
+            request.stats["speculative_skipped"] = "session"
+            return False
+        return True
+
+    def _run_single(self, request: GenerationRequest, allow_prefix: bool = True):
+        prefix = request.prefix if allow_prefix else None
+        produced = False
+        if self._speculative(request):
+            segments = self.speculative.stream(request.prompt, request.images, request.max_tokens,
+                                               request.temperature, prefix, request.stats, request.session)
+        else:
+            segments = self.generator.stream(request.prompt, request.images, request.max_tokens,
+                                             request.temperature, prefix, request.stats, request.session)
+        error = None
+        try:
+            for text in segments:
+                produced = True
+                if request.emit(text):
+                    break
+        except Exception as e:
+            error = e
+        # Run the generator's cleanup (e.g. the session cache commit) before anyone hears the request is done
+        try:
+            segments.close()
+        except Exception as e:
+            error = error or e
+        if error is not None:
+            if prefix is not None and not produced:
+                print(f"⚠️ Prefix cache generation failed, prefilling in full: {error}")
+                metrics.incr("prefix_cache_errors")
+                self._run_single(request, allow_prefix=False)
+                return
+            request.finish(error)
+            return
+        request.finish()
+
+    def _run_batch(self, batch: List[GenerationRequest]):
+        generator = self.generator
+        rows = list(batch)
+        detokenizers = [generator.new_detokenizer() for _ in rows]
+        started = time.perf_counter()
+        try:
+            logits, prompt_cache, pads, prompt_ids = generator.prefill_batch(
+                [r.prompt for r in rows], [r.images for r in rows]
+            )
+        except Exception as e:
+            # Nothing has been emitted yet, so every request can still go the single-sequence way
+            print(f"⚠️ Batched prefill failed, running {len(rows)} requests one by one: {e}")
+            self.batch_failures += 1
+            metrics.incr("batch_failures")
+            for request in rows:
+                self._run_single(request)
+            return
+
+        prefill_ms = round((time.perf_counter() - started) * 1000, 1)
+        for request, ids in zip(rows, prompt_ids):
+            request.stats.update(prompt_tokens=len(ids), prefill_ms=prefill_ms, prefix_tokens_reused=0)
+        # Tokens each row's cache holds (or is about to), to seed cold sessions with
+        known = [list(ids) if r.session is not None else None for r, ids in zip(rows, prompt_ids)]
+        self.batches += 1
+        self.batched_requests += len(rows)
+        metrics.incr("batched_requests", len(rows))
+
+        try:
+            while rows:
+                tokens = generator.sample(logits, [r.temperature for r in rows])
+                keep = []
+                for i, (request, token) in enumerate(zip(rows, tokens.tolist())):
+                    if known[i] is not None:
+                        known[i].append(token)
+                    finished = token in generator.eos_token_ids
+                    if not finished:
+                        detokenizers[i].add_token(token)
+                        finished = request.emit(detokenizers[i].last_segment)
+                    if finished:
+                        detokenizers[i].finalize()
+                        if not request.cancelled:
+                            request.flush(detokenizers[i].last_segment)
+                        if request.session is not None:
+                            self._seed_session(request, known[i], prompt_cache, i, pads[i])
+                        request.finish()
+                    else:
+                        keep.append(i)
+
+                if not keep:
+                    break
+                if len(keep) < len(rows):
+                    generator.select_rows(prompt_cache, keep)
+                    tokens = tokens[generator.mx.array(keep)]
+                    rows = [rows[i] for i in keep]
+                    detokenizers = [detokenizers[i] for i in keep]
+                    pads = [pads[i] for i in keep]
+                    known = [known[i] for i in keep]
+                logits = generator.decode_batch(tokens, prompt_cache, pads)
+        except Exception as e:
+            print(f"⚠️ Batched decode failed: {e}")
+            self.batch_failures += 1
+            metrics.incr("batch_failures")
+            for request in rows:
+                request.finish(e)
+
+    def _seed_session(self, request: GenerationRequest, known: List[int], prompt_cache: list, row: int, pad: int):
+        # Before finish(): the caller releases the session as soon as the request is done
+        try:
+            self.generator.commit_row(request.session, known, prompt_cache, row, pad)
+        except Exception as e:
+            print(f"⚠️ Could not keep the batched KV cache for session {request.session.id}: {e}")
+            request.session.drop_cache()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth(),
+            "speculative": self.speculative.stats() if self.speculative else None,
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "batches": self.batches,
+            "batched_requests": self.batched_requests,
+            "avg_batch_size": round(self.batched_requests / self.batches, 2) if self.batches else 0,
+            "batch_failures": self.batch_failures
+        }
+
+    def shutdown(self, drain: bool = False):
+        """Stop taking requests; with `drain`, finish what is queued in the background, else fail it with SchedulerClosed"""
+        with self._submit_lock:
+            self._closed = True
+            if drain:
+                # Sorts after every real priority, so the thread exits once the queue is empty
+                self._queue.put((float("inf"), next(self._order), None))
+                return
+            self._running = False
+            # Nothing queued will run now; fail it rather than leave its caller waiting
+            while True:
+                try:
+                    _, _, request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is not None:
+                    request.finish(SchedulerClosed("Inference scheduler shut down before the request ran"))
+            self._queue.put((-1, next(self._order), None))
+        self._thread.join(timeout=5.0)
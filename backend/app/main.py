@@ -6,6 +6,9 @@ from contextlib import asynccontextmanager
 from app.chat import router as chat_router
 from app.video import router as video_router
 from app.mlx_service import get_mlx_service
+from app.camera_manager import get_camera_manager
+from app.admission import get_admission
+import os
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -14,6 +17,8 @@ async def lifespan(app: FastAPI):
     try:
         mlx_service = get_mlx_service()
         print(" MLX service initialized successfully")
+        # Probe cameras once after the AI camera is open, then refresh in the background
+        get_camera_manager().start_inventory_refresh(float(os.getenv("CAMERA_REFRESH_INTERVAL", "30")))
         yield
     except Exception as e:
         print(f" Failed to initialize MLX service: {e}")
@@ -55,10 +60,8 @@ async def health():
             "fastapi": "healthy",
             "mlx_vlm": mlx_service.vlm_model is not None,
             "webcam": mlx_service.webcam is not None,
-            "models": {
-                "vlm": "mlx-community/gemma-3n-E2B-it-4bit",
-                "tts": "prince-canuma/Kokoro-82M"
-            }
+            "pending_requests": get_admission().pending,
+            "models": mlx_service.model_info()["active"]
         }
     except Exception as e:
         return {"status": "error", "error": str(e)}
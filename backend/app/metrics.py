@@ -0,0 +1,40 @@
+# app/metrics.py
+import threading
+from collections import defaultdict, deque
+
+
+class Metrics:
+    """In-process counters and recent timing samples, served by /api/chat/metrics"""
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+
+    def incr(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            self._samples[name].append(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+            samples = {name: sorted(values) for name, values in self._samples.items() if values}
+
+        timings = {}
+        for name, values in samples.items():
+            pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+            timings[name] = {
+                "count": len(values),
+                "avg": round(sum(values) / len(values), 2),
+                "p50": round(pick(0.5), 2),
+                "p95": round(pick(0.95), 2)
+            }
+        return {"counters": counters, "timings": timings}
+
+
+# Global metrics
+metrics = Metrics()
@@ -4,25 +4,100 @@ import os
 import base64
 import asyncio
 import concurrent.futures
-from typing import Optional, List, AsyncGenerator
+from collections import deque
+import threading
+from typing import Optional, List, AsyncGenerator, AsyncIterator
 from PIL import Image
 import numpy as np
-import uuid
 import tempfile
 import time
 import re
 import aiohttp
 from dotenv import load_dotenv
+from app.audio_transport import AudioStore, clip_url
+from app.camera_manager import Frame, get_camera_manager
+from app.inference_scheduler import (PRIORITY_BATCH, PRIORITY_NORMAL, GenerationRequest, InferenceScheduler,
+                                     SchedulerClosed)
+from app.metrics import metrics
+from app.model_registry import ModelRegistry, tier_models
+from app.speculative import SpeculativeDecoder
+from app.sessions import ChatSession, SessionStore, pairs_from_messages
+from app.streaming import iterate_in_thread
+from app.text_stream import (SENTENCE_END, SentenceSplitter, SentenceStop, StreamingCleaner, parse_stop_policy,
+                             strip_directives, strip_formatting)
+from app.tts_cache import PhraseCache, phrase_key
+from app.tts_engine import SynthesisAborted, TTSEngine, encode_wav, join_wav
+from app.vision_cache import create_vision_cache
+from app.vlm_generation import VLMGenerator
 
 load_dotenv()
 
+# Constant instruction block for webcam chat. It is placed ahead of the images
+# so its KV state can be computed once and shared by every request.
+REPAIR_PREAMBLE = "You are LeRepairBot, a professional repair assistant. You can see through cameras and help with electronics repair. Be concise and practical use the image only if its useful according to user commamd."
+
+class VLMRuntime:
+    """One active VLM with everything built around it: generator, caches and scheduler.
+
+    Hot swap replaces the whole runtime at once; a request reads
+    `service.vlm` once and uses that set throughout.
+    """
+
+    def __init__(self, name: str, loaded, generator: VLMGenerator, vision_cache, scheduler: InferenceScheduler,
+                 prefix_cache=None, draft: Optional[str] = None):
+        self.name = name
+        self.model = loaded["model"]
+        self.processor = loaded["processor"]
+        self.config = loaded["config"]
+        self.generator = generator
+        self.vision_cache = vision_cache
+        self.scheduler = scheduler
+        self.prefix_cache = prefix_cache
+        self.draft = draft
+
+    @property
+    def pinned(self) -> List[str]:
+        return [name for name in (self.name, self.draft) if name]
+
+
 class MLXService:
     def __init__(self):
-        self.vlm_model = None
-        self.vlm_processor = None
-        self.vlm_config = None
+        # Active VLM runtime; None until load_models() succeeds
+        self.vlm: Optional[VLMRuntime] = None
+        self.tts: Optional[TTSEngine] = None
+        # Clips handed out by id over /api/chat/audio/clips/{id}
+        self.audio_clips = AudioStore(ttl=float(os.getenv("AUDIO_CLIP_TTL", "300")))
+        # Repeated phrases (greetings, hand-over requests, errors) are spoken from cache
+        self.tts_cache = PhraseCache(
+            int(float(os.getenv("TTS_CACHE_MB", "32")) * 1024 * 1024),
+            directory=os.getenv("TTS_CACHE_DIR") or None,
+            max_disk_bytes=int(float(os.getenv("TTS_CACHE_DISK_MB", "512")) * 1024 * 1024)
+        )
         self.webcam = None
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+        # Models resident at once are bounded by MODEL_MEMORY_MB; MODEL_TIER picks the defaults
+        self.models = ModelRegistry(int(float(os.getenv("MODEL_MEMORY_MB", "12288")) * 1024 * 1024))
+        self.model_names = tier_models()
+        self._swap_lock = threading.Lock()
+        # Oldest frame a chat turn will accept before waiting on the grabber
+        self.max_frame_age = float(os.getenv("MAX_FRAME_AGE", "0.5"))
+        # Cameras sent to the VLM with each chat turn, e.g. "wrist,top" for a multi-image prompt
+        self.vlm_camera_roles = [r.strip() for r in os.getenv("VLM_CAMERA_ROLES", "ai").split(",") if r.strip()]
+        # How much of the reply users get: first_sentence, sentences:N or full.
+        # Decoding stops as soon as that much has been generated.
+        self.max_sentences = parse_stop_policy(os.getenv("RESPONSE_STOP_POLICY", "first_sentence"))
+        # Default for requests that don't choose; needs DRAFT_MODEL
+        self.speculative_default = os.getenv("SPECULATIVE_DECODING", "0") == "1"
+        # Multi-turn conversations keep their KV cache between turns
+        self.sessions = SessionStore(
+            max_bytes=int(float(os.getenv("SESSION_CACHE_MB", "512")) * 1024 * 1024),
+            ttl=float(os.getenv("SESSION_TTL", "1800")),
+            max_sessions=int(os.getenv("SESSION_MAX", "32")),
+            max_tokens=int(os.getenv("SESSION_MAX_TOKENS", "8192"))
+        )
+        # Every admitted request may park a worker waiting on scheduler tokens; keep spares for capture/TTS
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=int(os.getenv("MAX_PENDING_REQUESTS", "8")) + 4
+        )
         
         # Simple robot integration (optional)
         self.robot_ip = os.getenv("ROBOT_IP")  
@@ -32,23 +107,28 @@ class MLXService:
         self.load_models()
         self.init_webcam()
     
+    # Read-only views of the active runtime, for callers that predate hot swap
+    vlm_model = property(lambda self: self.vlm.model if self.vlm else None)
+    vlm_processor = property(lambda self: self.vlm.processor if self.vlm else None)
+    vlm_config = property(lambda self: self.vlm.config if self.vlm else None)
+    vlm_generator = property(lambda self: self.vlm.generator if self.vlm else None)
+    vision_cache = property(lambda self: self.vlm.vision_cache if self.vlm else None)
+    scheduler = property(lambda self: self.vlm.scheduler if self.vlm else None)
+    prefix_cache = property(lambda self: self.vlm.prefix_cache if self.vlm else None)
+    
     def load_models(self):
         """Load MLX models"""
         try:
-            from mlx_vlm import load, generate
+            from mlx_vlm import generate, stream_generate
             from mlx_vlm.prompt_utils import apply_chat_template
-            from mlx_vlm.utils import load_config
-            from mlx_audio.tts.generate import generate_audio
             
-            print("🔄 Loading MLX models...")
-            
-            model_path = "mlx-community/gemma-3n-E2B-it-4bit"
-            self.vlm_model, self.vlm_processor = load(model_path)
-            self.vlm_config = load_config(model_path)
+            print(f"🔄 Loading MLX models ({self.model_names})...")
             
             self.generate_vlm = generate
+            self.stream_generate_vlm = stream_generate
             self.apply_chat_template = apply_chat_template
-            self.generate_audio_fn = generate_audio
+            self.vlm = self.build_vlm_runtime(self.model_names["vlm"])
+            self.tts = self.build_tts_engine()
             
             print(" MLX models loaded successfully")
             
@@ -56,53 +136,193 @@ class MLXService:
             print(f" Failed to load MLX models: {e}")
             raise e
     
+    def build_vlm_runtime(self, name: str) -> VLMRuntime:
+        """Load (or reuse) VLM `name` and build its generator, caches and scheduler; pins its models"""
+        loaded = self.models.get(name, "vlm", pin=True)
+        try:
+            generator = VLMGenerator(loaded["model"], loaded["processor"], loaded["config"])
+            # Near-identical frames (follow-up questions on the same bench scene) skip the vision encoder
+            vision_cache = create_vision_cache(
+                loaded["model"],
+                float(os.getenv("VISION_CACHE_MB", "64")),
+                int(os.getenv("VISION_CACHE_THRESHOLD", "4"))
+            )
+            draft, speculative = self.load_draft_model(generator)
+            # Sole user of the VLM: batches requests arriving within BATCH_WINDOW_MS of each other
+            scheduler = InferenceScheduler(
+                generator,
+                window_ms=float(os.getenv("BATCH_WINDOW_MS", "15")),
+                max_batch=int(os.getenv("MAX_BATCH_SIZE", "4")),
+                speculative=speculative
+            )
+        except Exception:
+            self.models.unpin(name)
+            raise
+        prefix_cache = self.build_prefix_cache(generator) if os.getenv("PREFIX_CACHE", "1") != "0" else None
+        return VLMRuntime(name, loaded, generator, vision_cache, scheduler, prefix_cache, draft)
+    
+    def build_tts_engine(self) -> Optional[TTSEngine]:
+        """Resident TTS model with TTS_VOICES preloaded and one warm-up utterance (None if no TTS model)"""
+        name = self.model_names.get("tts")
+        if not name:
+            return None
+        loaded = self.models.get(name, "tts", pin=True)
+        engine = TTSEngine(loaded["model"], loaded.spec.path)
+        voices = [v.strip() for v in os.getenv("TTS_VOICES", "am_michael").split(",") if v.strip()]
+        try:
+            engine.preload(voices)
+            if voices:
+                engine.warm(voices[0])
+        except Exception as e:
+            # Voices still load on first use
+            print(f"⚠️ TTS warm-up failed: {e}")
+        return engine
+    
+    def activate_vlm(self, name: str) -> dict:
+        """Hot-swap the VLM: new requests go to `name` while queued ones finish on the old model.
+        
+        The new runtime is fully built before the switch, so a failed load
+        leaves the current model serving. Session KV caches are dropped
+        (they belong to the old model); their text history carries over.
+        """
+        if self.models.spec(name, "vlm").kind != "vlm":
+            raise KeyError(f"'{name}' is not a vision-language model")
+        with self._swap_lock:
+            old = self.vlm
+            if old is not None and old.name == name:
+                return self.model_info()
+            start = time.perf_counter()
+            runtime = self.build_vlm_runtime(name)
+            self.vlm = runtime
+            self.model_names["vlm"] = name
+            self.sessions.drop_caches()
+            if old is not None:
+                old.scheduler.shutdown(drain=True)
+                for pinned in old.pinned:
+                    self.models.unpin(pinned)
+            swap_s = time.perf_counter() - start
+            metrics.observe("model_swap_s", swap_s)
+            print(f"🔁 VLM switched to {name} in {swap_s:.1f}s")
+        return self.model_info()
+    
+    def model_info(self) -> dict:
+        """Active models per slot and what the registry holds, for /api/chat/models"""
+        return {
+            "active": {**self.model_names, "vlm": self.vlm.name if self.vlm else None},
+            "tier": os.getenv("MODEL_TIER", "edge"),
+            "registry": self.models.stats()
+        }
+    
+    def _speculative_speedup(self) -> Optional[float]:
+        """Median standard ms/token over median speculative ms/token, once both modes have run"""
+        timings = metrics.snapshot()["timings"]
+        standard = timings.get("decode_ms_per_token_standard")
+        speculative = timings.get("decode_ms_per_token_speculative")
+        if not standard or not speculative or not speculative["p50"]:
+            return None
+        return round(standard["p50"] / speculative["p50"], 2)
+    
+    def load_draft_model(self, generator: VLMGenerator) -> tuple:
+        """(registry name, SpeculativeDecoder) for the tier's draft model, or (None, None) without one"""
+        name = self.model_names.get("draft")
+        if not name:
+            return None, None
+        try:
+            draft = self.models.get(name, "draft", pin=True)
+        except Exception as e:
+            print(f"⚠️ Draft model unavailable, speculative decoding disabled: {e}")
+            return None, None
+        try:
+            decoder = SpeculativeDecoder.create(generator, draft["model"], draft["tokenizer"],
+                                                int(os.getenv("DRAFT_TOKENS", "4")), name)
+        except Exception as e:
+            print(f"⚠️ Draft model unavailable, speculative decoding disabled: {e}")
+            decoder = None
+        if decoder is None:
+            self.models.unpin(name)
+            return None, None
+        return name, decoder
+    
+    def build_repair_prompt(self, question: str, num_images: int, session: Optional[ChatSession] = None,
+                            generator: Optional[VLMGenerator] = None) -> str:
+        """Chat-formatted webcam prompt: constant preamble, then the images, then the question.
+        
+        For a warm session only the continuation after its cached tokens is
+        returned; a cold session with history replays it as text-only turns.
+        """
+        generator = generator or self.vlm_generator
+        parts = [{"type": "image"} for _ in range(num_images)]
+        parts.append({"type": "text", "text": question})
+        if session is not None and session.warm:
+            return generator.format_continuation(parts)
+        if session is not None and session.history:
+            return generator.format_prompt(parts, session.history)
+        return generator.format_prompt([{"type": "text", "text": REPAIR_PREAMBLE + "\n\n"}] + parts)
+    
+    def build_prefix_cache(self, generator: VLMGenerator):
+        """Prefill the preamble once; requests fork its KV cache and only prefill images + question"""
+        try:
+            placeholder = Image.new("RGB", (64, 64))
+            prefix_cache = generator.build_prefix(self.build_repair_prompt("", 1, generator=generator), [placeholder])
+            if prefix_cache:
+                print(f" Prefix cache ready: {len(prefix_cache.tokens)} tokens, "
+                      f"{prefix_cache.nbytes / 1e6:.1f}MB, prefill {prefix_cache.prefill_ms:.0f}ms")
+            return prefix_cache
+        except Exception as e:
+            print(f"⚠️ Prefix cache disabled: {e}")
+            return None
+    
+    def inference_stats(self) -> dict:
+        """Scheduler and cache state for /api/chat/metrics"""
+        stats = {
+            "vision_cache": self.vision_cache.stats() if self.vision_cache else None,
+            "scheduler": self.scheduler.stats() if self.scheduler else None,
+            "sessions": self.sessions.stats(),
+            "speculative_speedup": self._speculative_speedup(),
+            "tts_cache": self.tts_cache.stats(),
+            "audio_clips": self.audio_clips.stats(),
+            "models": self.model_info()
+        }
+        if self.prefix_cache:
+            stats["prefix_cache"] = {
+                "tokens": len(self.prefix_cache.tokens),
+                "bytes": self.prefix_cache.nbytes,
+                "hits": self.prefix_cache.hits
+            }
+        return stats
+    
     def init_webcam(self):
-        """Initialize webcam - Camera 1 for AI"""
+        """Attach to the shared camera registry - "ai" role (camera 1, falling back to 0)"""
         try:
-            # Use camera index 1 for AI processing (backend) - CORRECT
-            self.webcam = cv2.VideoCapture(1)
-            if self.webcam.isOpened():
-                self.webcam.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-                self.webcam.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-                self.webcam.set(cv2.CAP_PROP_FPS, 30)
-                self.webcam.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-                print(" Webcam initialized at index 1 (AI processing)")
+            self.webcam = get_camera_manager().get_role("ai")
+            if self.webcam:
+                print(f" Webcam initialized at index {self.webcam.index} (AI processing)")
             else:
-                print("⚠️ Camera index 1 not available, trying index 0")
-                self.webcam = cv2.VideoCapture(0)
-                if self.webcam.isOpened():
-                    self.webcam.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-                    self.webcam.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
-                    self.webcam.set(cv2.CAP_PROP_FPS, 30)
-                    self.webcam.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-                    print(" Webcam initialized at index 0 (fallback)")
-                else:
-                    print(" No webcam available")
-                    self.webcam = None
+                print(" No webcam available")
         except Exception as e:
             print(f"⚠️ Webcam initialization failed: {e}")
             self.webcam = None
     
-    def clean_response_text(self, text: str) -> str:
+    def clean_response_text(self, text: str, max_sentences: Optional[int] = None) -> str:
         """Clean response text - remove asterisks and formatting"""
-        text = re.sub(r'\*+', '', text)  # Remove asterisks
-        text = re.sub(r'#+', '', text)   # Remove hashtags
-        text = re.sub(r'_+', '', text)   # Remove underscores
-        text = re.sub(r'\s+', ' ', text) # Remove extra whitespace
-        text = text.strip()
+        if max_sentences is None:
+            max_sentences = self.max_sentences
         
-        # Remove robot commands from user text
-        text = re.sub(r'ROBOT_ACTION:.*', '', text).strip()
+        # Same rules as the streamed text, so both agree on what the user sees
+        text = strip_formatting(strip_directives(text)).strip()
         
-        # Keep first sentence only
-        sentences = re.split(r'[.!?]+', text)
-        if sentences and sentences[0].strip():
-            clean_text = sentences[0].strip()
-            if not clean_text.endswith(('.', '!', '?')):
-                clean_text += '.'
-            return clean_text
+        if not max_sentences:
+            return text
         
-        return text
+        # Keep the first sentence(s) only - same boundaries as the stop policy
+        ends = list(SENTENCE_END.finditer(text))
+        if len(ends) >= max_sentences:
+            clean_text = text[:ends[max_sentences - 1].end()].strip()
+        else:
+            clean_text = text
+        if clean_text and not clean_text.endswith(('.', '!', '?')):
+            clean_text += '.'
+        return clean_text or text
     
     def extract_robot_action(self, ai_response: str) -> Optional[str]:
         """Extract robot action from AI response - LLM decides"""
@@ -136,70 +356,195 @@ class MLXService:
             print(f" Robot unreachable at {self.robot_ip}: {e}")
             return {"success": False, "error": str(e)}
     
-    async def async_webcam_capture(self) -> Optional[Image.Image]:
-        """Async webcam capture"""
+    async def async_webcam_capture_frame(self, newer_than: Optional[float] = None) -> Optional[Frame]:
+        """Async webcam capture - only hops to a worker thread if it has to wait for a frame"""
+        if self.webcam and (newer_than is None or self.webcam.has_frame_newer_than(newer_than)):
+            return self.capture_frame(newer_than)
         loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(self.executor, self.capture_current_frame)
+        return await loop.run_in_executor(self.executor, self.capture_frame, newer_than)
+    
+    async def async_webcam_capture(self, newer_than: Optional[float] = None) -> Optional[Image.Image]:
+        """Async webcam capture"""
+        frame = await self.async_webcam_capture_frame(newer_than)
+        return self.frame_to_image(frame) if frame else None
+    
+    def capture_frame(self, newer_than: Optional[float] = None, timeout: float = 1.0) -> Optional[Frame]:
+        """Latest buffered webcam frame, or the first one captured after `newer_than`"""
+        if not self.webcam or not self.webcam.is_opened():
+            return None
+        return self.webcam.get_frame(newer_than, timeout=timeout)
+    
+    def frame_to_image(self, frame: Frame) -> Image.Image:
+        frame_rgb = cv2.cvtColor(frame.image, cv2.COLOR_BGR2RGB)
+        return Image.fromarray(frame_rgb)
     
-    def capture_current_frame(self) -> Optional[Image.Image]:
+    def capture_current_frame(self, newer_than: Optional[float] = None) -> Optional[Image.Image]:
         """Capture webcam frame"""
-        if not self.webcam or not self.webcam.isOpened():
+        frame = self.capture_frame(newer_than)
+        if frame is None:
             return None
+        return self.frame_to_image(frame)
+    
+    def capture_camera_frames(self, roles: List[str], newer_than: Optional[float] = None) -> List[tuple]:
+        """Synchronized frames from several cameras as (role, Frame) pairs"""
+        frames = get_camera_manager().capture_synchronized(roles, newer_than)
+        if len(frames) > 1:
+            skew = max(f.timestamp for f in frames.values()) - min(f.timestamp for f in frames.values())
+            print(f"📷 Captured {list(frames)} with {skew * 1000:.0f}ms skew")
+        return [(role, frames[role]) for role in roles if role in frames]
+    
+    async def async_capture_camera_frames(self, roles: List[str], newer_than: Optional[float] = None) -> List[tuple]:
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, self.capture_camera_frames, roles, newer_than)
+    
+    def describe_frames(self, captured: List[tuple]) -> List[dict]:
+        """Which frames a request used, so sessions can be matched against recordings"""
+        now = time.time()
+        used = []
+        for role, frame in captured:
+            used.append({
+                "role": role,
+                "camera": frame.camera,
+                "seq": frame.seq,
+                "timestamp": frame.timestamp,
+                "age_ms": round((now - frame.timestamp) * 1000, 1)
+            })
+        print("📷 Frames used: " + ", ".join(f"camera {f['camera']} seq {f['seq']} ({f['age_ms']}ms old)" for f in used))
+        return used
+    
+    def _vlm_token_iterator(self, formatted_prompt: str, images: List[Image.Image], max_tokens: int,
+                            temperature: float, max_sentences: int = 0, stats: Optional[dict] = None,
+                            use_prefix_cache: bool = False, priority: int = PRIORITY_NORMAL,
+                            abort: Optional[threading.Event] = None, session: Optional[ChatSession] = None,
+                            speculative: Optional[bool] = None):
+        """Blocking iterator over decoded text segments, one per generated token.
         
-        for _ in range(3):  # Get latest frame
-            ret, frame = self.webcam.read()
-            if not ret:
-                return None
+        Generation runs on the inference scheduler, batched with whatever else
+        arrives at the same time. With `max_sentences` set, decoding ends once
+        those sentences (and any trailing ROBOT_ACTION directive) are complete
+        instead of running to max_tokens. With `use_prefix_cache`, a prompt
+        starting with the repair preamble resumes from its cached KV state.
+        Setting `abort` (client disconnected) ends decoding at the next token.
+        With a `session`, generation continues from (and updates) its KV cache.
+        `speculative` picks draft-model decoding (None: SPECULATIVE_DECODING).
+        """
+        stats = stats if stats is not None else {}
+        for attempt in range(2):
+            runtime = self.vlm
+            prefix = runtime.prefix_cache if use_prefix_cache else None
+            try:
+                request = runtime.scheduler.submit(GenerationRequest(
+                    formatted_prompt, images, max_tokens, temperature,
+                    stop=SentenceStop(max_sentences).should_stop,
+                    prefix=prefix,
+                    stats=stats,
+                    priority=priority,
+                    abort=abort,
+                    session=session,
+                    speculative=self.speculative_default if speculative is None else speculative
+                ))
+                break
+            except SchedulerClosed:
+                # The VLM was swapped between reading the runtime and submitting; use the new one
+                if attempt:
+                    raise
+        stats["model"] = runtime.name
+        first = True
+        try:
+            for text in request.tokens():
+                if first:
+                    self._record_prefill(stats, prefix)
+                    first = False
+                yield text
+        finally:
+            # Frees the batch row if the consumer stopped reading
+            request.cancel()
         
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        return Image.fromarray(frame_rgb)
+        if stats.get("stopped_early"):
+            saved = max(0, max_tokens - stats.get("generated_tokens", max_tokens))
+            stats["decode_steps_saved"] = saved
+            metrics.incr("decode_steps_saved", saved)
+            metrics.incr("early_stops")
+    
+    def _record_prefill(self, stats: dict, prefix):
+        if "prefill_ms" in stats:
+            metrics.observe("vlm_prefill_ms", stats["prefill_ms"])
+        reused = stats.get("prefix_tokens_reused", 0)
+        if reused:
+            # Estimated from the one-off prefix prefill; bench_prefill.py measures it directly
+            stats["prefill_ms_saved_est"] = round(prefix.prefill_ms, 1)
+            metrics.incr("prefix_cache_hits")
+            metrics.incr("prefix_tokens_reused", reused)
+            metrics.incr("prefill_ms_saved_est", prefix.prefill_ms)
+        session_reused = stats.get("session_tokens_reused", 0)
+        if session_reused:
+            metrics.incr("session_hits")
+            metrics.incr("session_tokens_reused", session_reused)
+    
+    async def stream_vlm_tokens(self, prompt: str, images: List[Image.Image], max_tokens: int = 50,
+                                temperature: float = 0.7, stats: Optional[dict] = None,
+                                max_sentences: Optional[int] = None, formatted_prompt: Optional[str] = None,
+                                use_prefix_cache: bool = False, priority: int = PRIORITY_NORMAL,
+                                abort: Optional[threading.Event] = None,
+                                session: Optional[ChatSession] = None,
+                                speculative: Optional[bool] = None) -> AsyncGenerator[str, None]:
+        """Yield raw token text from the VLM as it is decoded; fills `stats` with TTFT and rates"""
+        stats = stats if stats is not None else {}
+        stats.setdefault("stopped_early", False)
+        stats.setdefault("decode_steps_saved", 0)
+        if max_sentences is None:
+            max_sentences = self.max_sentences
+        start = time.perf_counter()
+        tokens = 0
+        
+        def make_iterator():
+            text = formatted_prompt or self.apply_chat_template(
+                self.vlm_processor,
+                self.vlm_config,
+                prompt,
+                num_images=len(images)
+            )
+            return self._vlm_token_iterator(text, images, max_tokens, temperature, max_sentences, stats,
+                                            use_prefix_cache, priority, abort, session, speculative)
+        
+        try:
+            async for text in iterate_in_thread(self.executor, make_iterator):
+                if tokens == 0:
+                    stats["ttft_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                    metrics.observe("vlm_ttft_ms", stats["ttft_ms"])
+                tokens += 1
+                yield text
+        finally:
+            elapsed = time.perf_counter() - start
+            stats["tokens"] = tokens
+            stats["total_ms"] = round(elapsed * 1000, 1)
+            if tokens > 1 and "ttft_ms" in stats:
+                decode_s = elapsed - stats["ttft_ms"] / 1000
+                stats["decode_tps"] = round((tokens - 1) / decode_s, 1) if decode_s > 0 else None
+                if decode_s > 0:
+                    # Split by mode so speculative decoding can be A/B compared
+                    mode = "speculative" if stats.get("speculative") else "standard"
+                    metrics.observe(f"decode_ms_per_token_{mode}", decode_s * 1000 / (tokens - 1))
+            metrics.observe("vlm_total_ms", stats["total_ms"])
+            metrics.incr("vlm_tokens", tokens)
     
     async def async_multimodal_chat_streaming(self, image: Image.Image, prompt: str, max_tokens: int = 50) -> AsyncGenerator[str, None]:
-        """Stream multimodal response"""
+        """Stream multimodal response - cleaned text, forwarded as the model decodes it"""
         try:
             print(f"👤 User prompt: '{prompt}'")
             
-            loop = asyncio.get_event_loop()
-            
-            def process_vlm():
-                formatted_prompt = self.apply_chat_template(
-                    self.vlm_processor, 
-                    self.vlm_config, 
-                    prompt,  # USER'S TEXT
-                    num_images=1
-                )
-                
-                response = self.generate_vlm(
-                    self.vlm_model, 
-                    self.vlm_processor, 
-                    formatted_prompt, 
-                    [image],  # Webcam image
-                    verbose=False,
-                    max_tokens=max_tokens,
-                    temperature=0.7
-                )
-                
-                return response
-            
-            response = await loop.run_in_executor(self.executor, process_vlm)
-            
-            # Get and clean text
-            if hasattr(response, 'text'):
-                full_text = response.text
-            elif isinstance(response, str):
-                full_text = response
-            else:
-                full_text = str(response)
-            
-            clean_text = self.clean_response_text(full_text)
-            print(f"🤖 Original: {full_text}")
-            print(f"🧹 Cleaned: {clean_text}")
-            
-            # Stream clean text
-            words = clean_text.split(' ')
-            for word in words:
-                yield word + ' '
-                await asyncio.sleep(0.02)
+            cleaner = StreamingCleaner(self.max_sentences)
+            stats = {}
+            async for token in self.stream_vlm_tokens(prompt, [image], max_tokens, temperature=0.7, stats=stats):
+                text = cleaner.feed(token)
+                if text:
+                    yield text
+            text = cleaner.finish()
+            if text:
+                yield text
+            
+            print(f"🤖 Original: {cleaner.raw}")
+            print(f"⏱️ TTFT {stats.get('ttft_ms')}ms, {stats.get('tokens')} tokens in {stats.get('total_ms')}ms")
                     
         except Exception as e:
             print(f" Multimodal error: {e}")
@@ -232,125 +577,340 @@ class MLXService:
         except Exception as e:
             print(f" TTS error: {e}")
     
-    def _generate_tts(self, text: str, voice: str) -> dict:
-        """Generate TTS"""
+    def _clip(self, text: str, audio: bytes, duration: float, cached: bool = False) -> dict:
+        return {"success": True, "audio": audio, "duration": duration, "text": text, "cached": cached}
+    
+    def inline_audio(self, clip: dict) -> dict:
+        """A clip as a JSON-ready TTS result, with the WAV base64-encoded into audio_data"""
+        if not clip.get("success"):
+            return clip
+        result = dict(clip)
+        result["audio_data"] = base64.b64encode(result.pop("audio")).decode()
+        if clip["duration"]:
+            metrics.observe("audio_bytes_per_s_inline", len(result["audio_data"]) / clip["duration"])
+        return result
+    
+    def deliver_clip(self, clip: dict, audio_format: Optional[str] = None) -> dict:
+        """A clip as sent to clients: base64 inline, or with `audio_format` a reference to the binary clip"""
+        if not audio_format or not clip.get("success"):
+            return self.inline_audio(clip)
+        result = dict(clip)
+        audio_id = self.audio_clips.put(result.pop("audio"), clip["duration"])
+        result.update(audio_id=audio_id, format=audio_format, audio_url=clip_url(audio_id, audio_format))
+        return result
+    
+    def cached_clip(self, text: str, voice: str, speed: float = 1.2) -> Optional[dict]:
+        """Clip from the in-memory phrase cache, or None - cheap enough for the event loop"""
+        if self.tts is None:
+            return None
+        cached = self.tts_cache.get(phrase_key(text, voice, speed, self.tts.sample_rate), memory_only=True)
+        return self._clip(text, *cached, cached=True) if cached else None
+    
+    def synthesize_clip(self, text: str, voice: str, speed: float = 1.2,
+                        abort: Optional[threading.Event] = None) -> dict:
+        """WAV clip for `text` - from the phrase cache, else synthesized and encoded in memory"""
+        if self.tts is None:
+            return {"success": False, "error": "No TTS model loaded"}
         try:
-            chunk_id = f"tts_{uuid.uuid4().hex[:8]}"
-            
-            result = self.generate_audio_fn(
-                text=text,
-                model_path="prince-canuma/Kokoro-82M",
-                voice=voice,
-                speed=1.2,
-                lang_code="a",
-                file_prefix=chunk_id,
-                audio_format="wav",
-                sample_rate=22050,
-                join_audio=True,
-                verbose=False
-            )
+            key = phrase_key(text, voice, speed, self.tts.sample_rate)
+            cached = self.tts_cache.get(key)
+            if cached:
+                return self._clip(text, *cached, cached=True)
             
-            # Find file
-            possible_paths = [
-                f"{chunk_id}.wav",
-                f"./{chunk_id}.wav", 
-                os.path.expanduser(f"~/.mlx_audio/outputs/{chunk_id}.wav")
-            ]
+            if abort is not None and abort.is_set():
+                return {"success": False, "error": "aborted"}
+            samples, sample_rate = self.tts.synthesize(text, voice, speed=speed, abort=abort)
+            audio_data = encode_wav(samples, sample_rate)
+            duration = len(samples) / sample_rate
+            self.tts_cache.put(key, audio_data, duration)
             
-            for path in possible_paths:
-                if os.path.exists(path):
-                    with open(path, 'rb') as f:
-                        audio_data = f.read()
-                        audio_b64 = base64.b64encode(audio_data).decode()
-                    
-                    try:
-                        import wave
-                        with wave.open(path, 'rb') as wav:
-                            duration = wav.getnframes() / wav.getframerate()
-                    except:
-                        duration = len(text) * 0.1
-                    
-                    try:
-                        os.remove(path)
-                    except:
-                        pass
-                    
-                    print(f" TTS generated: {len(audio_data)} bytes, {duration:.1f}s")
-                    
-                    return {
-                        "success": True,
-                        "audio_data": audio_b64,
-                        "duration": duration,
-                        "text": text
-                    }
+            print(f" TTS generated: {len(audio_data)} bytes, {duration:.1f}s")
             
-            return {"success": False, "error": "Audio file not found"}
+            return self._clip(text, audio_data, duration)
             
+        except SynthesisAborted:
+            return {"success": False, "error": "aborted"}
         except Exception as e:
             print(f" TTS error: {e}")
             return {"success": False, "error": str(e)}
     
-    async def webcam_chat(self, prompt: str, enable_tts: bool = True, max_tokens: int = 50) -> dict:
-        """Webcam chat - Gemma 3n format with instructions in user prompt"""
-        image = self.capture_current_frame()
-        if not image:
-            return {"error": "Failed to capture webcam frame"}
+    def _generate_tts(self, text: str, voice: str, speed: float = 1.2) -> dict:
+        """Generate TTS"""
+        return self.inline_audio(self.synthesize_clip(text, voice, speed))
+    
+    async def async_generate_tts(self, text: str, voice: str = "am_michael", speed: float = 1.2,
+                                 audio_format: Optional[str] = None) -> dict:
+        clip = self.cached_clip(text, voice, speed)
+        if clip is None:
+            loop = asyncio.get_event_loop()
+            clip = await loop.run_in_executor(self.executor, self.synthesize_clip, text, voice, speed)
+        return self.deliver_clip(clip, audio_format)
+    
+    async def batch_tts_stream(self, items: List[dict], audio_format: Optional[str] = None,
+                               abort: Optional[threading.Event] = None) -> AsyncGenerator[dict, None]:
+        """Speak many {"text", "voice", "speed"} items, yielding {"index", ...result} as each finishes.
+        
+        Cached phrases come back first without touching the model. The rest
+        run on one worker against the resident engine, grouped by voice so
+        each voice pipeline stays hot, and identical items are synthesized once.
+        """
+        jobs = {}  # (text, voice, speed) -> indices
+        for index, item in enumerate(items):
+            key = (item["text"], item.get("voice", "am_michael"), float(item.get("speed", 1.2)))
+            jobs.setdefault(key, []).append(index)
+        
+        todo = []
+        for key, indices in jobs.items():
+            clip = self.cached_clip(*key)
+            if clip is None:
+                todo.append(key)
+                continue
+            for index in indices:
+                yield {"index": index, **self.deliver_clip(clip, audio_format)}
+        todo.sort(key=lambda key: key[1])
+        
+        def synthesize_all():
+            for key in todo:
+                if abort and abort.is_set():
+                    return
+                yield key, self.synthesize_clip(*key)
+        
+        start = time.perf_counter()
+        async for key, clip in iterate_in_thread(self.executor, synthesize_all):
+            for index in jobs[key]:
+                yield {"index": index, **self.deliver_clip(clip, audio_format)}
+        if todo:
+            metrics.observe("tts_batch_ms", (time.perf_counter() - start) * 1000)
+            metrics.incr("tts_batch_items", len(items))
+    
+    async def speak_chat_stream(self, events: AsyncIterator[dict], voice: str = "am_michael",
+                                abort: Optional[threading.Event] = None,
+                                audio_format: Optional[str] = None) -> AsyncGenerator[dict, None]:
+        """Chat events passed through, plus an "audio" event per sentence of the reply.
+        
+        Each sentence goes to TTS as soon as the streamed text completes it, so
+        the first one is being spoken while the VLM is still decoding the rest.
+        Audio comes out in sentence order with `chunk_index`; the chunk for the
+        last sentence (only known once decoding ends) has `is_final`.
+        Without `audio_format` the WAV is inlined as base64 "audio_data"; with
+        one, the event carries an `audio_id` / `audio_url` for the binary
+        clip endpoint instead.
+        """
+        loop = asyncio.get_event_loop()
+        splitter = SentenceSplitter()
+        pending = deque()  # (sentence, future) in sentence order
+        start = time.perf_counter()
+        chunk_index = 0
+        
+        def synthesize(sentence: str):
+            cached = self.cached_clip(sentence, voice)
+            if cached:
+                future = loop.create_future()
+                future.set_result(cached)
+            else:
+                future = loop.run_in_executor(self.executor, self.synthesize_clip, sentence, voice, 1.2, abort)
+            pending.append((sentence, future))
+        
+        def audio_event(sentence: str, audio: dict, final: bool) -> Optional[dict]:
+            nonlocal chunk_index
+            if not audio.get("success"):
+                print(f" TTS failed for '{sentence}': {audio.get('error')}")
+                return None
+            if chunk_index == 0:
+                metrics.observe("tts_first_audio_ms", (time.perf_counter() - start) * 1000)
+            event = {
+                "type": "audio",
+                "chunk_index": chunk_index,
+                "is_final": final,
+                "text": sentence,
+                "duration": audio["duration"]
+            }
+            delivered = self.deliver_clip(audio, audio_format)
+            for field in ("audio_data", "audio_id", "format", "audio_url"):
+                if field in delivered:
+                    event[field] = delivered[field]
+            chunk_index += 1
+            return event
+        
+        finished = False
+        try:
+            async for event in events:
+                if event["type"] == "token":
+                    for sentence in splitter.feed(event["text"]):
+                        synthesize(sentence)
+                elif event["type"] == "done":
+                    # The held-back tail is always the last sentence
+                    rest = splitter.finish()
+                    if rest:
+                        synthesize(rest)
+                    finished = True
+                elif event["type"] == "error":
+                    yield event
+                    return
+                yield event
+                # Hand over audio that is ready, without waiting on the rest
+                while not finished and pending and pending[0][1].done():
+                    sentence, future = pending.popleft()
+                    audio = audio_event(sentence, future.result(), final=False)
+                    if audio:
+                        yield audio
+            
+            while pending and not (abort and abort.is_set()):
+                sentence, future = pending.popleft()
+                audio = audio_event(sentence, await future, final=not pending)
+                if audio:
+                    yield audio
+        finally:
+            # Nobody will hear these: free their workers for live requests
+            for _, future in pending:
+                future.cancel()
+    
+    async def webcam_chat_stream(self, prompt: str, max_tokens: int = 50,
+                                 camera_roles: Optional[List[str]] = None,
+                                 stop_policy: Optional[str] = None, priority: int = PRIORITY_NORMAL,
+                                 abort: Optional[threading.Event] = None, session_id: Optional[str] = None,
+                                 history: Optional[List[dict]] = None,
+                                 speculative: Optional[bool] = None) -> AsyncGenerator[dict, None]:
+        """Webcam chat as events: "frames", then "token" per cleaned text delta, then "done" (or "error").
+        
+        With `session_id`, the turn continues that conversation's cached context;
+        `history` (client-side messages) reseeds a session the server has lost.
+        """
+        session = self.sessions.get(session_id) if session_id else None
+        if session is not None and not session.lock.acquire(blocking=False):
+            yield {"type": "error", "error": "Session is busy with another turn"}
+            return
+        try:
+            async for event in self._webcam_turn(prompt, max_tokens, camera_roles, stop_policy, priority, abort,
+                                                 session, history, speculative):
+                yield event
+        finally:
+            if session is not None:
+                self.sessions.touch(session)
+                session.lock.release()
+    
+    async def _webcam_turn(self, prompt, max_tokens, camera_roles, stop_policy, priority, abort, session, history,
+                           speculative):
+        roles = camera_roles or self.vlm_camera_roles
+        try:
+            max_sentences = parse_stop_policy(stop_policy) if stop_policy else self.max_sentences
+        except ValueError as e:
+            yield {"type": "error", "error": str(e)}
+            return
+        newer_than = time.time() - self.max_frame_age
+        
+        if roles == ["ai"]:
+            # The grabber keeps the buffer current, so this normally returns at once
+            frame = await self.async_webcam_capture_frame(newer_than=newer_than)
+            captured = [("ai", frame)] if frame else []
+        else:
+            captured = await self.async_capture_camera_frames(roles, newer_than)
+        if not captured:
+            yield {"type": "error", "error": "Failed to capture webcam frame"}
+            return
+        frames_used = self.describe_frames(captured)
+        images = [self.frame_to_image(frame) for _, frame in captured]
+        yield {"type": "frames", "cameras": [role for role, _ in captured], "frames": frames_used}
         
         try:
             print(f"👤 User: '{prompt}'")
             
-            # Gemma 3n format: system instructions at the start of user prompt
-            gemma_prompt = f"""You are LeRepairBot, a professional repair assistant. You can see through cameras and help with electronics repair. Be concise and practical use the image only if its useful according to user commamd.
-
-{prompt}"""
-            
-            formatted_prompt = self.apply_chat_template(
-                self.vlm_processor, 
-                self.vlm_config, 
-                gemma_prompt,  # Instructions + user question in one prompt
-                num_images=1
-            )
-            
-            response = self.generate_vlm(
-                self.vlm_model, 
-                self.vlm_processor, 
-                formatted_prompt, 
-                [image],
-                verbose=False,  
-                max_tokens=max_tokens,
-                temperature=0.6
-            )
-            
-            if hasattr(response, 'text'):
-                ai_response = response.text
-            elif isinstance(response, str):
-                ai_response = response
-            else:
-                ai_response = str(response)
+            camera_note = ""
+            if len(captured) > 1:
+                views = ", ".join(f"image {i + 1} is the {role} camera" for i, (role, _) in enumerate(captured))
+                camera_note = f"These {len(captured)} views were taken at the same moment: {views}.\n\n"
+            
+            if session is not None and session.model != self.vlm.name:
+                # Cache was built by a VLM that has since been swapped out
+                session.drop_cache()
+                session.model = self.vlm.name
+            if session is not None and not session.history and history:
+                session.history = pairs_from_messages(history)
+                if session.history:
+                    first_user, first_reply = session.history[0]
+                    session.history[0] = (REPAIR_PREAMBLE + "\n\n" + first_user, first_reply)
+            # What the model sees as this user turn, for the session's text history
+            user_text = camera_note + prompt
+            if session is None or not (session.history or session.warm):
+                user_text = REPAIR_PREAMBLE + "\n\n" + user_text
+            
+            # Gemma 3n format: system instructions at the start of the user turn, ahead of the images
+            formatted_prompt = self.build_repair_prompt(camera_note + prompt, len(images), session)
+            
+            cleaner = StreamingCleaner(max_sentences)
+            stats = {}
+            async for token in self.stream_vlm_tokens(prompt, images, max_tokens, temperature=0.6,
+                                                      stats=stats, max_sentences=max_sentences,
+                                                      formatted_prompt=formatted_prompt, use_prefix_cache=True,
+                                                      priority=priority, abort=abort, session=session,
+                                                      speculative=speculative):
+                text = cleaner.feed(token)
+                if text:
+                    yield {"type": "token", "text": text}
+            text = cleaner.finish()
+            if text:
+                yield {"type": "token", "text": text}
             
             # Clean response for user
-            clean_response = self.clean_response_text(ai_response)
-            print(f"🤖 AI: '{clean_response}'")
-            
-            result = {
+            ai_response = cleaner.raw
+            clean_response = self.clean_response_text(ai_response, max_sentences)
+            print(f"🤖 AI: '{clean_response}' (TTFT {stats.get('ttft_ms')}ms, {stats.get('tokens')} tokens, "
+                  f"{stats.get('decode_steps_saved')} decode steps saved)")
+            if session is not None:
+                session.add_turn(user_text, ai_response)
+                stats["session_turn"] = session.turns
+            
+            yield {
+                "type": "done",
                 "ai_response": clean_response,
-                "prompt": prompt,
-                "has_webcam": True
+                "raw_response": ai_response,
+                "metrics": stats
             }
             
-            # Generate TTS
-            if enable_tts and clean_response:
-                tts_result = self._generate_tts(clean_response, "am_michael")
-                result["audio"] = tts_result
-            
-            return result
-            
         except Exception as e:
             print(f" Chat error: {e}")
-            return {"error": str(e)}
+            yield {"type": "error", "error": str(e)}
+    
+    async def webcam_chat(self, prompt: str, enable_tts: bool = True, max_tokens: int = 50,
+                          camera_roles: Optional[List[str]] = None, stop_policy: Optional[str] = None,
+                          priority: int = PRIORITY_NORMAL, abort: Optional[threading.Event] = None,
+                          session_id: Optional[str] = None, speculative: Optional[bool] = None) -> dict:
+        """Webcam chat - Gemma 3n format with instructions in user prompt.
+        
+        With TTS, sentences are synthesized while the rest of the reply decodes
+        and joined into one clip.
+        """
+        result = {"prompt": prompt}
+        chunks = []
+        events = self.webcam_chat_stream(prompt, max_tokens, camera_roles, stop_policy, priority, abort,
+                                         session_id, speculative=speculative)
+        if enable_tts:
+            events = self.speak_chat_stream(events, "am_michael", abort)
+        async for event in events:
+            if event["type"] == "error":
+                return {"error": event["error"]}
+            if event["type"] == "frames":
+                result.update(has_webcam=True, cameras=event["cameras"], frames=event["frames"])
+            elif event["type"] == "done":
+                result.update(ai_response=event["ai_response"], raw_response=event["raw_response"],
+                              metrics=event["metrics"])
+            elif event["type"] == "audio":
+                chunks.append(event)
+        
+        if chunks:
+            result["audio"] = {
+                "success": True,
+                "audio_data": base64.b64encode(join_wav([base64.b64decode(c["audio_data"]) for c in chunks])).decode(),
+                "duration": sum(c["duration"] for c in chunks),
+                "text": " ".join(c["text"] for c in chunks),
+                "chunks": len(chunks)
+            }
+        
+        return result
     
-    def process_image_chat(self, image: Image.Image, prompt: str, max_tokens: int = 50) -> str:
-        """Process image + text with VLM"""
+    def process_image_chat(self, image: Image.Image, prompt: str, max_tokens: int = 50,
+                           priority: int = PRIORITY_BATCH) -> str:
+        """Process image + text with VLM - queued behind interactive turns by default"""
         try:
             formatted_prompt = self.apply_chat_template(
                 self.vlm_processor, 
@@ -359,20 +919,17 @@ class MLXService:
                 num_images=1
             )
             
-            response = self.generate_vlm(
-                self.vlm_model, 
-                self.vlm_processor, 
+            # Stops at the sentence boundary the cleaned reply is cut at
+            response = "".join(self._vlm_token_iterator(
                 formatted_prompt, 
                 [image],
-                verbose=False,
                 max_tokens=max_tokens,
-                temperature=0.7
-            )
+                temperature=0.7,
+                max_sentences=self.max_sentences,
+                priority=priority
+            ))
             
-            if hasattr(response, 'text'):
-                return self.clean_response_text(response.text)
-            else:
-                return self.clean_response_text(str(response))
+            return self.clean_response_text(response)
                 
         except Exception as e:
             print(f" Image chat error: {e}")
@@ -388,27 +945,29 @@ class MLXService:
     
     def cleanup(self):
         """Cleanup"""
-        if self.webcam:
-            self.webcam.release()
-            print("🧹 Webcam released")
+        get_camera_manager().shutdown()
+        self.webcam = None
+        if self.vlm:
+            self.vlm.scheduler.shutdown()
         if hasattr(self, 'executor'):
             self.executor.shutdown(wait=True)
             print("🧹 Thread pool cleaned up")
 
-    def get_camera_info(self):
-        """Get info about available cameras"""
+    def get_camera_info(self, refresh: bool = False):
+        """Get info about available cameras from the cached inventory"""
+        manager = get_camera_manager()
+        if refresh or not manager.inventory_updated:
+            manager.refresh_inventory()
+        
         cameras = []
-        for i in range(4):  # Check first 4 camera indices
-            cap = cv2.VideoCapture(i)
-            if cap.isOpened():
-                width = cap.get(cv2.CAP_PROP_FRAME_WIDTH)
-                height = cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        for i, info in manager.inventory().items():
+            if info["available"]:
                 cameras.append({
                     "index": i,
-                    "width": int(width),
-                    "height": int(height)
+                    "width": info["width"],
+                    "height": info["height"],
+                    "roles": info["roles"]
                 })
-                cap.release()
         return cameras
 
 # Global service
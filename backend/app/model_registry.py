@@ -0,0 +1,228 @@
+# app/model_registry.py
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from app.metrics import metrics
+
+
+class ModelSpec:
+    """A loadable model: its kind ("vlm", "tts", "draft") and Hugging Face path"""
+
+    def __init__(self, kind: str, path: str):
+        self.kind = kind
+        self.path = path
+
+
+CATALOG: Dict[str, ModelSpec] = {
+    "gemma-3n-e2b": ModelSpec("vlm", "mlx-community/gemma-3n-E2B-it-4bit"),
+    "gemma-3n-e4b": ModelSpec("vlm", "mlx-community/gemma-3n-E4B-it-4bit"),
+    "kokoro": ModelSpec("tts", "prince-canuma/Kokoro-82M"),
+    "gemma-3-270m": ModelSpec("draft", "mlx-community/gemma-3-270m-it-4bit"),
+}
+
+# Models per deployment tier (MODEL_TIER); VLM_MODEL / TTS_MODEL / DRAFT_MODEL override a slot
+TIERS = {
+    "edge": {"vlm": "gemma-3n-e2b", "tts": "kokoro", "draft": None},
+    "standard": {"vlm": "gemma-3n-e2b", "tts": "kokoro", "draft": "gemma-3-270m"},
+    "quality": {"vlm": "gemma-3n-e4b", "tts": "kokoro", "draft": "gemma-3-270m"},
+}
+
+
+def tier_models(tier: Optional[str] = None) -> Dict[str, Optional[str]]:
+    """Model name per slot for a tier, after environment overrides"""
+    tier = tier or os.getenv("MODEL_TIER", "edge")
+    if tier not in TIERS:
+        raise ValueError(f"Unknown model tier '{tier}' (expected one of {', '.join(TIERS)})")
+    models = dict(TIERS[tier])
+    for slot in models:
+        override = os.getenv(f"{slot.upper()}_MODEL")
+        if override is not None:
+            models[slot] = override or None
+    return models
+
+
+def parameter_nbytes(model) -> int:
+    """Bytes held by an MLX module's parameters"""
+    try:
+        from mlx.utils import tree_flatten
+        return sum(array.nbytes for _, array in tree_flatten(model.parameters()))
+    except Exception:
+        return 0
+
+
+def _load_vlm(path: str) -> dict:
+    from mlx_vlm import load
+    from mlx_vlm.utils import load_config
+    model, processor = load(path)
+    return {"model": model, "processor": processor, "config": load_config(path)}
+
+
+def _load_tts(path: str) -> dict:
+    from mlx_audio.tts.utils import load_model
+    return {"model": load_model(path)}
+
+
+def _load_draft(path: str) -> dict:
+    from mlx_lm import load as load_lm
+    model, tokenizer = load_lm(path)
+    return {"model": model, "tokenizer": tokenizer}
+
+
+LOADERS = {"vlm": _load_vlm, "tts": _load_tts, "draft": _load_draft}
+
+
+class ModelBudgetError(MemoryError):
+    """A model needs more memory than MODEL_MEMORY_MB allows, even with everything else unloaded"""
+
+
+class LoadedModel:
+    def __init__(self, name: str, spec: ModelSpec, parts: dict, load_s: float):
+        self.name = name
+        self.spec = spec
+        self.parts = parts
+        self.nbytes = parameter_nbytes(parts["model"])
+        self.load_s = load_s
+        self.last_used = time.time()
+        self.pins = 0
+
+    def __getitem__(self, key):
+        return self.parts[key]
+
+    def describe(self) -> dict:
+        return {
+            "kind": self.spec.kind,
+            "path": self.spec.path,
+            "memory_mb": round(self.nbytes / 1024 / 1024, 1),
+            "load_s": round(self.load_s, 1),
+            "pinned": self.pins > 0,
+            "idle_s": round(time.time() - self.last_used, 1)
+        }
+
+
+class ModelRegistry:
+    """Loads models by name on first use and keeps them resident under a memory budget.
+
+    Names come from CATALOG; any other name is treated as a Hugging Face path
+    (pass `kind`). Past `budget_bytes`, least-recently-used models that
+    nobody has pinned are unloaded. Loads of the same name are deduplicated.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self._models: "OrderedDict[str, LoadedModel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def spec(self, name: str, kind: Optional[str] = None) -> ModelSpec:
+        if name in CATALOG:
+            return CATALOG[name]
+        if kind is None:
+            raise KeyError(f"Unknown model '{name}' - give its kind to load it by path")
+        return ModelSpec(kind, name)
+
+    def get(self, name: str, kind: Optional[str] = None, pin: bool = False) -> LoadedModel:
+        """The resident model, loading it first if needed; `pin` also pins it before anything can evict it"""
+        with self._lock:
+            loaded = self._models.get(name)
+            if loaded is not None:
+                self._models.move_to_end(name)
+                loaded.last_used = time.time()
+                loaded.pins += pin
+                return loaded
+            name_lock = self._loading.setdefault(name, threading.Lock())
+
+        with name_lock:
+            with self._lock:
+                loaded = self._models.get(name)
+                if loaded is not None:
+                    loaded.pins += pin
+                    return loaded
+
+            spec = self.spec(name, kind)
+            print(f"🔄 Loading {spec.kind} model {name} ({spec.path})...")
+            start = time.perf_counter()
+            parts = LOADERS[spec.kind](spec.path)
+            loaded = LoadedModel(name, spec, parts, time.perf_counter() - start)
+            print(f" Loaded {name}: {loaded.nbytes / 1024 / 1024:.0f}MB in {loaded.load_s:.1f}s")
+            metrics.observe("model_load_s", loaded.load_s)
+            if loaded.nbytes > self.budget_bytes:
+                needed_mb = loaded.nbytes / 1024 / 1024
+                del loaded, parts
+                self._release_memory()
+                raise ModelBudgetError(
+                    f"Model {name} needs {needed_mb:.0f}MB, more than the {self.budget_bytes / 1024 / 1024:.0f}MB "
+                    f"model memory budget (MODEL_MEMORY_MB)"
+                )
+
+            with self._lock:
+                self._models[name] = loaded
+                loaded.pins += pin
+                self.loads += 1
+                # The new model stays even if pinned ones keep the total over budget for now
+                self._enforce_budget(keep=name)
+            return loaded
+
+    def pin(self, name: str):
+        with self._lock:
+            loaded = self._models.get(name)
+            if loaded is None:
+                raise KeyError(f"Model '{name}' is not loaded")
+            loaded.pins += 1
+
+    def unpin(self, name: str):
+        with self._lock:
+            loaded = self._models.get(name)
+            if loaded is not None and loaded.pins:
+                loaded.pins -= 1
+            self._enforce_budget()
+
+    def unload(self, name: str) -> bool:
+        with self._lock:
+            loaded = self._models.get(name)
+            if loaded is None or loaded.pins:
+                return False
+            del self._models[name]
+        self._release_memory()
+        return True
+
+    def _enforce_budget(self, keep: Optional[str] = None):
+        total = sum(m.nbytes for m in self._models.values())
+        evicted = False
+        for name, loaded in list(self._models.items()):
+            if total <= self.budget_bytes:
+                break
+            if loaded.pins or name == keep:
+                continue
+            print(f"🧹 Unloading {name} to stay within the model memory budget")
+            total -= loaded.nbytes
+            del self._models[name]
+            self.evictions += 1
+            metrics.incr("model_evictions")
+            evicted = True
+        if evicted:
+            self._release_memory()
+
+    @staticmethod
+    def _release_memory():
+        try:
+            import mlx.core as mx
+            clear = getattr(mx, "clear_cache", None) or mx.metal.clear_cache
+            clear()
+        except Exception:
+            pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = {name: loaded.describe() for name, loaded in self._models.items()}
+            return {
+                "budget_mb": round(self.budget_bytes / 1024 / 1024),
+                "resident_mb": round(sum(m.nbytes for m in self._models.values()) / 1024 / 1024, 1),
+                "models": models,
+                "loads": self.loads,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,144 @@
+# app/sessions.py
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from app.metrics import metrics
+from app.vlm_generation import prompt_cache_nbytes
+
+
+def pairs_from_messages(messages: List[dict]) -> List[Tuple[str, str]]:
+    """(user, assistant) text pairs from client-side chat messages, dropping the unanswered last one"""
+    pairs, pending = [], None
+    for message in messages:
+        content = message.get("content")
+        if not isinstance(content, str):
+            continue
+        if message.get("role") == "user":
+            pending = content
+        elif message.get("role") == "assistant" and pending is not None:
+            pairs.append((pending, content))
+            pending = None
+    return pairs
+
+
+class ChatSession:
+    """One conversation: its text history plus the KV cache of every token seen so far.
+
+    `tokens` is exactly what `prompt_cache` holds, so the next turn only has
+    to prefill its own tokens. `history` is (user text, reply) pairs, used to
+    rebuild the prompt cold when the cache is gone.
+    """
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.history: List[Tuple[str, str]] = []
+        self.tokens: List[int] = []
+        self.prompt_cache: Optional[list] = None
+        # VLM the cache was built with; a cache is useless to any other model
+        self.model: Optional[str] = None
+        self.nbytes = 0
+        self.turns = 0
+        self.created = time.time()
+        self.last_used = self.created
+        self.lock = threading.Lock()
+
+    @property
+    def warm(self) -> bool:
+        return self.prompt_cache is not None
+
+    def commit(self, tokens: List[int], prompt_cache: list):
+        self.tokens = tokens
+        self.prompt_cache = prompt_cache
+        self.nbytes = prompt_cache_nbytes(prompt_cache)
+
+    def drop_cache(self):
+        self.tokens = []
+        self.prompt_cache = None
+        self.nbytes = 0
+
+    def add_turn(self, user_text: str, reply: str):
+        self.history.append((user_text, reply))
+        self.turns += 1
+
+
+class SessionStore:
+    """Chat sessions by conversation id, bounded by idle TTL, count and total KV bytes.
+
+    Eviction is least-recently-used first and skips sessions mid-turn.
+    Sessions over `max_tokens` lose their cache and continue from text
+    history, so one long walkthrough can't pin memory indefinitely.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float = 1800, max_sessions: int = 32, max_tokens: int = 8192):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_tokens = max_tokens
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, session_id: str) -> ChatSession:
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ChatSession(session_id)
+                self._sessions[session_id] = session
+                metrics.incr("sessions_created")
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.time()
+            return session
+
+    def touch(self, session: ChatSession):
+        """Account for a session's new cache size after a turn"""
+        with self._lock:
+            if len(session.tokens) > self.max_tokens:
+                session.drop_cache()
+                metrics.incr("session_cache_resets")
+            session.last_used = time.time()
+            self._enforce_budget(keep=session.id)
+
+    def drop_caches(self):
+        """Forget every session's KV cache (the VLM changed); text histories stay"""
+        with self._lock:
+            for session in self._sessions.values():
+                session.drop_cache()
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for session_id, session in list(self._sessions.items()):
+            if session.last_used < cutoff and not session.lock.locked():
+                del self._sessions[session_id]
+                self.evictions += 1
+                metrics.incr("sessions_expired")
+
+    def _enforce_budget(self, keep: str):
+        total = sum(s.nbytes for s in self._sessions.values())
+        for session_id, session in list(self._sessions.items()):
+            if total <= self.max_bytes and len(self._sessions) <= self.max_sessions:
+                break
+            if session_id == keep or session.lock.locked():
+                continue
+            total -= session.nbytes
+            del self._sessions[session_id]
+            self.evictions += 1
+            metrics.incr("sessions_evicted")
+        if total > self.max_bytes:
+            # Only the active session is left over budget: keep its text, drop its KV
+            session = self._sessions.get(keep)
+            if session:
+                session.drop_cache()
+                metrics.incr("session_cache_resets")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "warm": sum(1 for s in self._sessions.values() if s.warm),
+                "bytes": sum(s.nbytes for s in self._sessions.values()),
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,230 @@
+# app/speculative.py
+import threading
+import time
+from typing import Iterator, List, Optional
+
+from PIL import Image
+
+from app.metrics import metrics
+
+
+class SpeculativeDecoder:
+    """Draft-and-verify decoding for the VLM with a small text-only draft model.
+
+    The draft (an mlx_lm model sharing Gemma's vocabulary) sees the prompt
+    without its image tokens and proposes `num_draft` tokens; the VLM scores
+    all of them in one forward pass over its image-conditioned cache. The
+    longest agreeing run is kept plus one token from the VLM itself, so the
+    output follows the VLM's distribution (exactly, for greedy decoding).
+    """
+
+    def __init__(self, generator, draft_model, draft_tokenizer, num_draft: int = 4):
+        self.generator = generator
+        self.mx = generator.mx
+        self.draft_model = draft_model
+        self.draft_tokenizer = draft_tokenizer
+        self.num_draft = num_draft
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.verify_steps = 0
+        self.drafted = 0
+        self.accepted = 0
+
+    @classmethod
+    def create(cls, generator, draft_model, draft_tokenizer, num_draft: int = 4,
+               name: str = "draft") -> Optional["SpeculativeDecoder"]:
+        """Decoder for an already-loaded draft model, or None if it can't draft for this VLM"""
+        decoder = cls(generator, draft_model, draft_tokenizer, num_draft)
+        if not decoder.compatible():
+            print(f"⚠️ Draft model {name} uses a different vocabulary, speculative decoding disabled")
+            return None
+        return decoder
+
+    def compatible(self) -> bool:
+        probe = "Check the 3.3V rail with a multimeter before reflowing the connector."
+        target = self.generator.tokenizer.encode(probe, add_special_tokens=False)
+        draft = self.draft_tokenizer.encode(probe, add_special_tokens=False)
+        return list(target) == list(draft)
+
+    def _draft_cache(self) -> list:
+        from mlx_lm.models.cache import make_prompt_cache
+        return make_prompt_cache(self.draft_model)
+
+    @staticmethod
+    def _trim(prompt_cache: list, count: int) -> bool:
+        if count <= 0:
+            return True
+        if not all(getattr(layer, "is_trimmable", lambda: False)() for layer in prompt_cache):
+            return False
+        for layer in prompt_cache:
+            layer.trim(count)
+        return True
+
+    def _probs(self, logits, temperature: float):
+        mx = self.mx
+        return mx.softmax(logits.astype(mx.float32) / max(temperature, 1e-5), axis=-1)
+
+    def _pick(self, logits, temperature: float) -> int:
+        mx = self.mx
+        if temperature == 0:
+            return mx.argmax(logits, axis=-1).item()
+        return mx.random.categorical(logits / temperature).item()
+
+    def stream(self, prompt: str, images: List[Image.Image], max_tokens: int = 50, temperature: float = 0.7,
+               prefix=None, stats: Optional[dict] = None, session=None) -> Iterator[str]:
+        """Same contract as VLMGenerator.stream: one text segment per accepted token.
+
+        A cold `session` is seeded with the verified tokens' cache afterwards;
+        warm sessions never get here (see InferenceScheduler._speculative).
+        """
+        mx = self.mx
+        generator = self.generator
+        stats = stats if stats is not None else {}
+        inputs = generator.prepare(prompt, images)
+        prompt_ids = inputs["input_ids"][0].tolist()
+        stats["prompt_tokens"] = len(prompt_ids)
+
+        window = generator.max_batch_context()
+        if window and len(prompt_ids) + max_tokens + self.num_draft >= window:
+            # Rejected drafts can't be rolled back once sliding-window layers wrap
+            stats["speculative"] = False
+            yield from generator.stream(prompt, images, max_tokens, temperature, prefix, stats, session)
+            return
+
+        skip = prefix.match(inputs["input_ids"]) if prefix else 0
+        target_cache = prefix.fork() if skip else generator.make_cache()
+        stats["prefix_tokens_reused"] = skip
+        input_ids, pixel_values, mask, extra = generator._split_inputs(inputs, skip)
+
+        start = time.perf_counter()
+        outputs = generator.model(input_ids, pixel_values, mask=mask, cache=target_cache, **extra)
+        token = self._pick(getattr(outputs, "logits", outputs)[0, -1], temperature)
+
+        # The draft only ever sees text: the prompt minus image placeholders, then the reply
+        draft_ids = [t for t in prompt_ids if t != generator.image_token_index]
+        draft_cache = self._draft_cache()
+        self.draft_model(mx.array(draft_ids[:-1])[None], cache=draft_cache)
+        draft_pending = [draft_ids[-1]]
+        stats["prefill_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+        detokenizer = generator.new_detokenizer()
+        drafted = accepted = steps = generated = 0
+        # Tokens target_cache holds: the prompt, then every verified token
+        known = list(prompt_ids)
+        completed = False
+        try:
+            while True:
+                if token in generator.eos_token_ids:
+                    break
+                detokenizer.add_token(token)
+                generated += 1
+                yield detokenizer.last_segment
+                if generated >= max_tokens:
+                    break
+
+                # Draft k tokens after `token`
+                k = min(self.num_draft, max_tokens - generated)
+                draft_pending.append(token)
+                proposals, proposal_probs = [], []
+                feed = draft_pending
+                for _ in range(k):
+                    logits = self.draft_model(mx.array(feed)[None], cache=draft_cache)[0, -1]
+                    proposed = self._pick(logits, temperature)
+                    proposals.append(proposed)
+                    if temperature:
+                        proposal_probs.append(self._probs(logits, temperature))
+                    feed = [proposed]
+                draft_pending = []
+
+                # Verify `token` + proposals in one VLM pass; position i predicts proposal i
+                verify = mx.array([token] + proposals)[None]
+                outputs = generator.model.language_model(verify, cache=target_cache)
+                target_logits = getattr(outputs, "logits", outputs)[0]
+                steps += 1
+                drafted += k
+
+                kept = 0
+                correction = None
+                for i, proposed in enumerate(proposals):
+                    if temperature == 0:
+                        choice = mx.argmax(target_logits[i]).item()
+                        if choice != proposed:
+                            correction = choice
+                            break
+                    else:
+                        p = self._probs(target_logits[i], temperature)
+                        q = proposal_probs[i]
+                        if mx.random.uniform().item() >= min(1.0, (p[proposed] / q[proposed]).item()):
+                            residual = mx.maximum(p - q, 0)
+                            correction = mx.random.categorical(mx.log(residual / residual.sum())).item()
+                            break
+                    kept += 1
+                accepted += kept
+                if correction is None:
+                    correction = self._pick(target_logits[k], temperature)
+
+                # Roll both caches back to the accepted tokens
+                rejected = k - kept
+                target_ok = self._trim(target_cache, rejected)
+                # The draft fed `token` + proposals[:-1]; the last proposal was never fed
+                if kept == k:
+                    draft_pending = [proposals[-1]]
+                    draft_ok = True
+                else:
+                    draft_ok = self._trim(draft_cache, k - 1 - kept)
+                if not (target_ok and draft_ok):
+                    raise RuntimeError("cache cannot be rolled back (sliding window exceeded)")
+                known += [token] + proposals[:kept]
+
+                for proposed in proposals[:kept]:
+                    if proposed in generator.eos_token_ids:
+                        correction = proposed
+                        break
+                    detokenizer.add_token(proposed)
+                    generated += 1
+                    yield detokenizer.last_segment
+                    if generated >= max_tokens:
+                        break
+                if generated >= max_tokens:
+                    break
+                token = correction
+            completed = True
+        except GeneratorExit:
+            # Stopped at a yield, where known and target_cache always agree
+            completed = True
+            raise
+        finally:
+            self._record(stats, drafted, accepted, steps)
+            if session is not None:
+                generator._commit_session(session, known, target_cache, completed)
+
+        detokenizer.finalize()
+        if detokenizer.last_segment:
+            yield detokenizer.last_segment
+
+    def _record(self, stats: dict, drafted: int, accepted: int, steps: int):
+        stats["speculative"] = True
+        stats["draft_tokens"] = drafted
+        stats["draft_accepted"] = accepted
+        stats["acceptance_rate"] = round(accepted / drafted, 3) if drafted else None
+        with self._lock:
+            self.requests += 1
+            self.verify_steps += steps
+            self.drafted += drafted
+            self.accepted += accepted
+        metrics.incr("spec_draft_tokens", drafted)
+        metrics.incr("spec_accepted_tokens", accepted)
+        metrics.incr("spec_verify_steps", steps)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "num_draft": self.num_draft,
+                "requests": self.requests,
+                "drafted": self.drafted,
+                "accepted": self.accepted,
+                "acceptance_rate": round(self.accepted / self.drafted, 3) if self.drafted else None,
+                # Tokens emitted per VLM decode pass (1.0 = no gain)
+                "tokens_per_verify": round((self.accepted + self.verify_steps) / self.verify_steps, 2)
+                if self.verify_steps else None
+            }
@@ -0,0 +1,78 @@
+# app/streaming.py
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, AsyncIterator, Callable, Iterator, TypeVar
+
+from app.metrics import metrics
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+async def iterate_in_thread(executor, make_iterator: Callable[[], Iterator[T]]) -> AsyncGenerator[T, None]:
+    """Run a blocking iterator on a worker thread and yield its items as they are produced.
+
+    Items cross into the event loop one by one, so consumers see each token
+    the moment the worker has it. If the consumer stops early (client gone,
+    early stop), the worker is told to stop at its next item.
+    """
+    loop = asyncio.get_event_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def run():
+        iterator = None
+        try:
+            iterator = make_iterator()
+            for item in iterator:
+                if stop.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, (_DONE, e))
+            return
+        finally:
+            close = getattr(iterator, "close", None)
+            if close:
+                close()
+        loop.call_soon_threadsafe(queue.put_nowait, (_DONE, None))
+
+    future = loop.run_in_executor(executor, run)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _DONE:
+                if error:
+                    raise error
+                break
+            yield item
+    finally:
+        stop.set()
+        await asyncio.shield(future)
+
+
+@asynccontextmanager
+async def disconnect_watch(request, interval: float = 0.25) -> AsyncIterator[threading.Event]:
+    """Event that is set once the HTTP client behind `request` disconnects.
+
+    Handed down to the inference scheduler, it aborts decoding at the next
+    token, and lets the handler skip work nobody will receive (TTS).
+    """
+    gone = threading.Event()
+
+    async def watch():
+        while not gone.is_set():
+            if await request.is_disconnected():
+                print("🔌 Client disconnected, aborting generation")
+                metrics.incr("client_disconnects")
+                gone.set()
+                return
+            await asyncio.sleep(interval)
+
+    task = asyncio.create_task(watch())
+    try:
+        yield gone
+    finally:
+        task.cancel()
@@ -0,0 +1,171 @@
+# app/text_stream.py
+import re
+from typing import List
+
+ROBOT_MARKER = "ROBOT_ACTION:"
+ROBOT_DIRECTIVE = re.compile(r'ROBOT_ACTION:\s*\w+')
+# What the user never sees: a directive and the rest of its line
+ROBOT_LINE = re.compile(r'ROBOT_ACTION:.*')
+# A terminator only ends a sentence when followed by whitespace, so "3.5V" stays whole
+SENTENCE_END = re.compile(r'[.!?]+(?=\s|$)')
+
+
+def strip_directives(text: str, final: bool = True) -> str:
+    """Raw model output without its ROBOT_ACTION lines; unless `final`, a partial marker at the end is held back too.
+
+    Must run before strip_formatting - formatting cleanup eats the marker's underscore.
+    """
+    text = ROBOT_LINE.sub('', text)
+    if not final:
+        for size in range(min(len(ROBOT_MARKER) - 1, len(text)), 0, -1):
+            if ROBOT_MARKER.startswith(text[-size:]):
+                return text[:-size]
+    return text
+
+
+def strip_formatting(text: str) -> str:
+    """Markdown and whitespace cleanup shared by streamed and final text"""
+    text = re.sub(r'\*+', '', text)
+    text = re.sub(r'#+', '', text)
+    text = re.sub(r'_+', '', text)
+    return re.sub(r'\s+', ' ', text)
+
+
+class StreamingCleaner:
+    """Incremental version of MLXService.clean_response_text for streamed tokens.
+
+    Feed raw decoder output and get back only the new user-visible text:
+    formatting stripped, ROBOT_ACTION lines removed, and nothing past the
+    first `max_sentences` sentences. Text that might still turn into a
+    directive is held back until the next token decides it.
+    """
+
+    def __init__(self, max_sentences: int = 1):
+        self.max_sentences = max_sentences
+        self.raw = ""
+        self.emitted = ""
+        self.complete = False
+
+    def _visible(self, final: bool) -> str:
+        # An unfinished directive line is dropped until its newline arrives
+        text = strip_formatting(strip_directives(self.raw, final)).lstrip()
+
+        if self.max_sentences:
+            ends = list(SENTENCE_END.finditer(text))
+            if len(ends) >= self.max_sentences:
+                end = ends[self.max_sentences - 1]
+                # A terminator run at the very end may still grow ("..." / "?!")
+                if final or end.end() < len(text):
+                    self.complete = True
+                    return text[:end.end()]
+
+        return text if final else text.rstrip()
+
+    def feed(self, token: str) -> str:
+        """Add raw decoder output, return newly visible text"""
+        if self.complete:
+            self.raw += token
+            return ""
+        self.raw += token
+        return self._advance(final=False)
+
+    def finish(self) -> str:
+        """Flush whatever was held back once decoding has ended"""
+        if self.complete:
+            return ""
+        return self._advance(final=True)
+
+    def _advance(self, final: bool) -> str:
+        visible = self._visible(final).rstrip() if final else self._visible(final)
+        if not visible.startswith(self.emitted):
+            # Only possible if held-back text changed meaning; never re-send
+            return ""
+        new = visible[len(self.emitted):]
+        self.emitted = visible
+        return new
+
+
+class SentenceSplitter:
+    """Cuts cleaned streaming text into sentences as soon as each one is complete.
+
+    A sentence is released once its terminator is followed by more text, the
+    same rule the stop policy uses, so "3.5V" or a growing "..." isn't cut.
+    The last sentence comes out of finish().
+    """
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self.buffer += text
+        sentences = []
+        while True:
+            match = SENTENCE_END.search(self.buffer)
+            if not match or match.end() >= len(self.buffer):
+                return sentences
+            sentence = self.buffer[:match.end()].strip()
+            self.buffer = self.buffer[match.end():]
+            if sentence:
+                sentences.append(sentence)
+
+    def finish(self) -> str:
+        sentence, self.buffer = self.buffer.strip(), ""
+        return sentence
+
+
+def parse_stop_policy(spec: str) -> int:
+    """Sentences to keep for a policy spec: "first_sentence" -> 1, "sentences:N" -> N, "full" -> 0 (no limit)"""
+    spec = (spec or "first_sentence").strip().lower()
+    if spec == "full":
+        return 0
+    if spec == "first_sentence":
+        return 1
+    if spec.startswith("sentences:"):
+        count = int(spec.split(":", 1)[1])
+        if count < 0:
+            raise ValueError(f"Invalid stop policy '{spec}'")
+        return count
+    raise ValueError(f"Invalid stop policy '{spec}'")
+
+
+class SentenceStop:
+    """Decides when decoding can end because everything the user will see has been generated.
+
+    That is the first `max_sentences` complete sentences plus, if the model
+    starts one, a trailing ROBOT_ACTION directive. A few grace tokens after
+    the last sentence give the model the chance to begin that directive.
+    """
+
+    def __init__(self, max_sentences: int = 1, grace_tokens: int = 3):
+        self.max_sentences = max_sentences
+        self.grace_tokens = grace_tokens
+        self._pending = 0
+
+    def should_stop(self, raw: str) -> bool:
+        if not self.max_sentences:
+            return False
+
+        marker = raw.find(ROBOT_MARKER)
+        if marker >= 0:
+            # Let the action name finish - it needs a following character to be known complete
+            match = ROBOT_DIRECTIVE.match(raw, marker)
+            if not match or match.end() >= len(raw):
+                return False
+
+        body = strip_directives(raw)
+        ends = list(SENTENCE_END.finditer(body))
+        if len(ends) < self.max_sentences:
+            return False
+        end = ends[self.max_sentences - 1]
+        if end.end() >= len(body):
+            # A terminator run at the very end may still grow ("..." / "3.5")
+            return False
+        if marker >= 0:
+            return True
+
+        # Underscores are kept here so a partial "ROBOT_ACTION" is still recognised
+        tail = re.sub(r'[*#\s]+', '', body[end.end():])
+        if tail and not ROBOT_MARKER.startswith(tail[:len(ROBOT_MARKER)]):
+            return True
+        self._pending += 1
+        return self._pending > self.grace_tokens
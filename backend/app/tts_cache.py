@@ -0,0 +1,173 @@
+# app/tts_cache.py
+import hashlib
+import io
+import os
+import threading
+import unicodedata
+import wave
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.metrics import metrics
+
+
+def phrase_key(text: str, voice: str, speed: float, sample_rate: int) -> str:
+    """Content address of an utterance; whitespace and Unicode form don't change the audio"""
+    normalized = " ".join(unicodedata.normalize("NFC", text).split())
+    return hashlib.sha256(f"{voice}|{speed:.3f}|{sample_rate}|{normalized}".encode()).hexdigest()
+
+
+def wav_duration(audio: bytes) -> float:
+    with wave.open(io.BytesIO(audio), "rb") as wav:
+        return wav.getnframes() / wav.getframerate()
+
+
+class PhraseCache:
+    """Synthesized speech by content, in an LRU memory tier and an optional disk tier.
+
+    The memory tier holds encoded WAVs up to `max_bytes`. With `directory`,
+    every clip is also written there as <key>.wav, so stock phrases survive
+    a restart; the disk tier drops its least-recently-read files past
+    `max_disk_bytes`. Its sizes and recency are tracked in memory, seeded by
+    one directory scan at startup, so a write doesn't rescan the directory.
+    """
+
+    def __init__(self, max_bytes: int, directory: Optional[str] = None, max_disk_bytes: int = 512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.seconds_saved = 0.0
+        # Disk tier: key -> file size, least recently used first
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self.disk_bytes = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._scan_disk()
+
+    def get(self, key: str, memory_only: bool = False) -> Optional[Tuple[bytes, float]]:
+        """(wav bytes, duration) or None; `memory_only` never touches the disk (safe on the event loop)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hit(entry)
+                return entry
+        if memory_only:
+            return None
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.disk_hits += 1
+                self._hit(entry)
+                self._remember(key, entry)
+        metrics.incr("tts_cache_misses" if entry is None else "tts_cache_disk_hits")
+        return entry
+
+    def _hit(self, entry: Tuple[bytes, float]):
+        self.hits += 1
+        self.bytes_saved += len(entry[0])
+        self.seconds_saved += entry[1]
+        metrics.incr("tts_cache_hits")
+
+    def put(self, key: str, audio: bytes, duration: float):
+        with self._lock:
+            self._remember(key, (audio, duration))
+        if self.directory:
+            self._write_disk(key, audio)
+
+    def _remember(self, key: str, entry: Tuple[bytes, float]):
+        if len(entry[0]) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.nbytes -= len(previous[0])
+        self._entries[key] = entry
+        self.nbytes += len(entry[0])
+        while self.nbytes > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.nbytes -= len(evicted)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.wav")
+
+    def _read_disk(self, key: str) -> Optional[Tuple[bytes, float]]:
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)  # recency for the next startup scan
+        except OSError:
+            with self._lock:
+                self.disk_bytes -= self._disk.pop(key, 0)
+            return None
+        with self._lock:
+            if key in self._disk:
+                self._disk.move_to_end(key)
+        try:
+            return audio, wav_duration(audio)
+        except (wave.Error, EOFError):
+            return None
+
+    def _write_disk(self, key: str, audio: bytes):
+        path = self._path(key)
+        try:
+            # Write-then-rename so a concurrent reader never sees half a file
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(audio)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"⚠️ TTS cache write failed: {e}")
+            return
+        with self._lock:
+            self.disk_bytes += len(audio) - self._disk.pop(key, 0)
+            self._disk[key] = len(audio)
+            victims = []
+            while self.disk_bytes > self.max_disk_bytes and len(self._disk) > 1:
+                victim, size = self._disk.popitem(last=False)
+                self.disk_bytes -= size
+                victims.append(victim)
+        for victim in victims:
+            try:
+                os.remove(self._path(victim))
+            except OSError:
+                pass
+
+    def _scan_disk(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".wav"):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, name[:-len(".wav")], stat.st_size))
+        for _, key, size in sorted(files):
+            self._disk[key] = size
+            self.disk_bytes += size
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "disk": self.directory,
+                "disk_bytes": self.disk_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "audio_s_saved": round(self.seconds_saved, 1)
+            }
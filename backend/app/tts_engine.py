@@ -0,0 +1,118 @@
+# app/tts_engine.py
+import io
+import re
+import threading
+import time
+import wave
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.metrics import metrics
+
+# Kokoro voices are prefixed with their language: "am_michael" is American English, "bf_emma" British
+KOKORO_LANGS = {"a", "b", "e", "f", "h", "i", "j", "p", "z"}
+# <language><f|m>_<name>, e.g. "af_heart"
+KOKORO_VOICE = re.compile(r'([a-z])[fm]_[a-z0-9]+')
+
+
+class SynthesisAborted(Exception):
+    """The listener went away while an utterance was being synthesized"""
+
+
+def is_kokoro_voice(voice: str) -> bool:
+    match = KOKORO_VOICE.fullmatch(voice)
+    return bool(match) and match.group(1) in KOKORO_LANGS
+
+
+def voice_lang(voice: str) -> str:
+    return voice[0] if voice and voice[0] in KOKORO_LANGS else "a"
+
+
+def encode_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+    """16-bit mono WAV built in memory from float samples in [-1, 1]"""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def join_wav(clips: List[bytes]) -> bytes:
+    """One WAV from several in the same format, e.g. the per-sentence chunks of a reply"""
+    if len(clips) == 1:
+        return clips[0]
+    frames, params = [], None
+    for clip in clips:
+        with wave.open(io.BytesIO(clip), "rb") as wav:
+            params = params or wav.getparams()
+            frames.append(wav.readframes(wav.getnframes()))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setparams(params)
+        wav.writeframes(b"".join(frames))
+    return buffer.getvalue()
+
+
+class TTSEngine:
+    """A resident Kokoro model with one pipeline per language and its voices preloaded.
+
+    `mlx_audio`'s generate_audio loads the weights and builds a pipeline on
+    every call; here both are built once and reused, so an utterance only
+    pays for synthesis. Calls are serialized: the pipeline isn't thread-safe.
+    """
+
+    def __init__(self, model, repo_id: str):
+        self.model = model
+        self.repo_id = repo_id
+        self.sample_rate = getattr(model, "sample_rate", 24000)
+        self._pipelines: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self.utterances = 0
+
+    def pipeline(self, lang_code: str):
+        pipeline = self._pipelines.get(lang_code)
+        if pipeline is None:
+            from mlx_audio.tts.models.kokoro import KokoroPipeline
+            pipeline = KokoroPipeline(lang_code=lang_code, model=self.model, repo_id=self.repo_id)
+            self._pipelines[lang_code] = pipeline
+        return pipeline
+
+    def preload(self, voices: Iterable[str]):
+        """Load voice embeddings (and their language pipelines) ahead of the first request"""
+        with self._lock:
+            for voice in voices:
+                self.pipeline(voice_lang(voice)).load_voice(voice)
+
+    def warm(self, voice: str):
+        """One throwaway utterance so the first real one doesn't pay for graph setup"""
+        start = time.perf_counter()
+        self.synthesize("Ready.", voice)
+        print(f" TTS warmed up in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    def synthesize(self, text: str, voice: str, speed: float = 1.0,
+                   abort: Optional[threading.Event] = None) -> Tuple[np.ndarray, int]:
+        """(float32 mono samples, sample rate) for `text`; raises SynthesisAborted once `abort` is set"""
+        start = time.perf_counter()
+        with self._lock:
+            pipeline = self.pipeline(voice_lang(voice))
+            chunks = []
+            results = pipeline(text, voice=voice, speed=speed)
+            try:
+                for result in results:
+                    # Checked between chunks: a chunk already started can't be interrupted
+                    if abort is not None and abort.is_set():
+                        raise SynthesisAborted(text)
+                    if result.audio is not None:
+                        chunks.append(np.asarray(result.audio, dtype=np.float32).reshape(-1))
+            finally:
+                close = getattr(results, "close", None)
+                if close:
+                    close()
+            self.utterances += 1
+        samples = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+        metrics.observe("tts_ms", (time.perf_counter() - start) * 1000)
+        return samples, self.sample_rate
@@ -1,59 +1,117 @@
 # app/video.py
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import StreamingResponse
-import cv2
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
+from email.utils import formatdate
 import numpy as np
 from app.mlx_service import get_mlx_service
-import io
+from app.camera_manager import get_camera_manager
+import time
+from typing import Optional
 from PIL import Image
 
 router = APIRouter()
 
-# Store multiple camera instances
-cameras = {}
+def get_camera(camera_index: int = 0, role: Optional[str] = None):
+    """Get the shared capture stream for given index, or for a configured role"""
+    manager = get_camera_manager()
+    if role:
+        if role not in manager.roles:
+            raise HTTPException(status_code=404, detail=f"Unknown camera role '{role}'")
+        return manager.get_role(role)
+    return manager.get(camera_index)
 
-def get_camera(camera_index: int = 0):
-    """Get or create camera instance for given index"""
-    if camera_index not in cameras:
-        cap = cv2.VideoCapture(camera_index)
-        if cap.isOpened():
-            cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)  # Changed to 1280
-            cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)  # Changed to 720
-            cap.set(cv2.CAP_PROP_FPS, 30)
-            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            cameras[camera_index] = cap
-            print(f" Camera {camera_index} initialized")
-        else:
-            print(f" Camera {camera_index} not available")
-            return None
+# Width ladder used when a client falls behind; fixed steps keep JPEG variants shareable
+WIDTH_STEPS = [1280, 960, 640, 480, 320]
+MIN_QUALITY = 40
+
+class AdaptiveQuality:
+    """Lowers JPEG quality, then resolution, while a client's sends lag behind its target fps"""
+    
+    def __init__(self, target_fps: float, quality: int, max_width: int):
+        self.interval = 1.0 / target_fps
+        self.max_quality = quality
+        self.quality = quality
+        self.widths = [w for w in WIDTH_STEPS if w < max_width]
+        self.widths.insert(0, max_width)
+        self.width_step = 0
+        self.send_time = 0.0
+        self.samples = 0
     
-    return cameras[camera_index]
+    @property
+    def width(self) -> int:
+        return self.widths[self.width_step]
+    
+    def record(self, seconds: float):
+        """Feed the time the last frame took to send and adjust settings"""
+        self.send_time = seconds if self.samples == 0 else 0.8 * self.send_time + 0.2 * seconds
+        self.samples += 1
+        if self.samples < 5:
+            return
+        
+        if self.send_time > self.interval * 1.2:
+            if self.quality > MIN_QUALITY:
+                self.quality = max(MIN_QUALITY, self.quality - 10)
+            elif self.width_step < len(self.widths) - 1:
+                self.width_step += 1
+            else:
+                return
+            self.samples = 0
+        elif self.send_time < self.interval * 0.5:
+            if self.width_step > 0:
+                self.width_step -= 1
+            elif self.quality < self.max_quality:
+                self.quality = min(self.max_quality, self.quality + 5)
+            else:
+                return
+            self.samples = 0
 
 @router.get("/stream")
-async def video_stream(camera_index: int = Query(0, description="Camera index (0, 1, 2, etc.)")):
+async def video_stream(
+    camera_index: int = Query(0, description="Camera index (0, 1, 2, etc.)"),
+    role: Optional[str] = Query(None, description="Camera role (ai, wrist, top), overrides camera_index"),
+    fps: float = Query(30, gt=0, le=60, description="Target frames per second"),
+    max_width: int = Query(1280, ge=160, description="Max frame width, keeps aspect ratio"),
+    quality: int = Query(80, ge=10, le=100, description="Starting JPEG quality")
+):
     """Stream webcam video feed from specified camera"""
     
-    camera = get_camera(camera_index)
-    if not camera or not camera.isOpened():
-        raise HTTPException(status_code=503, detail=f"Camera {camera_index} not available")
+    # Opening a cold device can block for seconds; keep it off the event loop
+    camera = await run_in_threadpool(get_camera, camera_index, role)
+    if not camera or not camera.is_opened():
+        raise HTTPException(status_code=503, detail=f"Camera {role or camera_index} not available")
+    camera_index = camera.index
     
     def generate_frames():
-        while True:
-            try:
-                ret, frame = camera.read()
-                if not ret:
-                    break
+        # Own queue of size 1: stale frames are dropped in favour of the newest
+        subscriber = camera.subscribe(maxsize=1, name="mjpeg")
+        adaptive = AdaptiveQuality(fps, quality, min(max_width, camera.width))
+        next_send = time.monotonic()
+        try:
+            while camera.is_opened():
+                # Honour the client's target fps; the queue keeps only the newest frame meanwhile
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                
+                frame = subscriber.get(timeout=1.0)
+                if frame is None:
+                    continue
                 
-                # Convert frame to JPEG
-                _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-                frame_bytes = buffer.tobytes()
+                frame_bytes = camera.encode_jpeg(frame, quality=adaptive.quality, width=adaptive.width)
                 
+                sent_at = time.monotonic()
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                       
-            except Exception as e:
-                print(f"Error generating frame from camera {camera_index}: {e}")
-                break
+                # Resumed once the server has written the chunk, so this is the send time
+                now = time.monotonic()
+                adaptive.record(now - sent_at)
+                next_send = max(next_send + adaptive.interval, now)
+                
+        except Exception as e:
+            print(f"Error generating frame from camera {camera_index}: {e}")
+        finally:
+            subscriber.close()
     
     return StreamingResponse(
         generate_frames(),
@@ -61,44 +119,70 @@ async def video_stream(camera_index: int = Query(0, description="Camera index (0
     )
 
 @router.get("/capture")
-async def capture_frame(camera_index: int = Query(0, description="Camera index")):
+async def capture_frame(
+    request: Request,
+    camera_index: int = Query(0, description="Camera index"),
+    role: Optional[str] = Query(None, description="Camera role (ai, wrist, top), overrides camera_index"),
+    quality: int = Query(90, ge=10, le=100, description="JPEG quality"),
+    width: Optional[int] = Query(None, ge=16, description="Max width, keeps aspect ratio")
+):
     """Capture a single frame from specified camera"""
     
-    camera = get_camera(camera_index)
-    if not camera or not camera.isOpened():
-        raise HTTPException(status_code=503, detail=f"Camera {camera_index} not available")
+    camera = await run_in_threadpool(get_camera, camera_index, role)
+    if not camera or not camera.is_opened():
+        raise HTTPException(status_code=503, detail=f"Camera {role or camera_index} not available")
+    camera_index = camera.index
     
     try:
-        ret, frame = camera.read()
-        if not ret:
+        # Waits up to a second on the grabber
+        frame = await run_in_threadpool(camera.get_frame)
+        if frame is None:
             raise HTTPException(status_code=500, detail=f"Failed to capture frame from camera {camera_index}")
         
-        # Convert frame to JPEG
-        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])
-        frame_bytes = buffer.tobytes()
+        # Frames are immutable per seq, so the validators identify the bytes exactly
+        etag = f'"{camera_index}-{frame.seq}-{quality}-{width or 0}"'
+        headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(frame.timestamp, usegmt=True),
+            "Cache-Control": "no-cache"
+        }
+        
+        # Only the ETag is exact: several frames share one Last-Modified second, so
+        # If-Modified-Since is deliberately ignored
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        
+        frame_bytes = await run_in_threadpool(camera.encode_jpeg, frame, quality=quality, width=width)
         
-        return StreamingResponse(
-            io.BytesIO(frame_bytes),
-            media_type="image/jpeg"
+        return Response(
+            content=frame_bytes,
+            media_type="image/jpeg",
+            headers=headers
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error capturing frame from camera {camera_index}: {str(e)}")
 
 @router.get("/status")
-async def video_status():
+async def video_status(refresh: bool = Query(False, description="Re-probe devices before answering")):
     """Get status of all cameras"""
-    camera_status = {}
+    manager = get_camera_manager()
+    if refresh or not manager.inventory_updated:
+        await run_in_threadpool(manager.refresh_inventory)
     
-    # Check cameras 0-3
-    for i in range(4):
-        camera = get_camera(i)
-        if camera and camera.isOpened():
+    camera_status = {}
+    for i, info in manager.inventory().items():
+        if info["available"]:
             camera_status[f"camera_{i}"] = {
                 "available": True,
-                "width": int(camera.get(cv2.CAP_PROP_FRAME_WIDTH)),
-                "height": int(camera.get(cv2.CAP_PROP_FRAME_HEIGHT)),
-                "fps": int(camera.get(cv2.CAP_PROP_FPS))
+                "active": info["active"],
+                "width": info["width"],
+                "height": info["height"],
+                "fps": info["fps"],
+                "roles": info["roles"]
             }
         else:
             camera_status[f"camera_{i}"] = {
@@ -107,10 +191,16 @@ async def video_status():
     
     return camera_status
 
+@router.get("/stats")
+async def video_stats():
+    """Per-device capture/delivery rates and dropped frames"""
+    manager = get_camera_manager()
+    return {
+        "roles": manager.roles,
+        "cameras": manager.stats()
+    }
+
 @router.on_event("shutdown")
 async def cleanup_cameras():
     """Cleanup camera resources on shutdown"""
-    for camera_index, camera in cameras.items():
-        if camera:
-            camera.release()
-            print(f"🧹 Camera {camera_index} released")
\ No newline at end of file
+    get_camera_manager().shutdown()
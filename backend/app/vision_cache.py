@@ -0,0 +1,149 @@
+# app/vision_cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from app.metrics import metrics
+
+
+def perceptual_hash(pixels: np.ndarray, size: int = 8) -> int:
+    """64-bit difference hash of one preprocessed image (channels-first or channels-last).
+
+    Neighbouring cells of a (size x size+1) grey thumbnail are compared, so
+    sensor noise and small exposure changes leave most bits untouched.
+    """
+    if pixels.ndim == 3 and pixels.shape[0] in (1, 3, 4):
+        grey = pixels.mean(axis=0)
+    elif pixels.ndim == 3:
+        grey = pixels.mean(axis=2)
+    else:
+        grey = pixels
+    height, width = grey.shape
+    rows = np.array_split(np.arange(height), size)
+    cols = np.array_split(np.arange(width), size + 1)
+    thumb = np.array([[grey[np.ix_(r, c)].mean() for c in cols] for r in rows])
+    bits = (thumb[:, 1:] > thumb[:, :-1]).flatten()
+    return int(sum(1 << i for i, bit in enumerate(bits) if bit))
+
+
+class VisionEmbeddingCache:
+    """LRU of vision-encoder outputs keyed by perceptual hash.
+
+    A lookup hits when a stored hash is within `threshold` differing bits;
+    entries are evicted oldest-first once their arrays exceed `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int, threshold: int = 4):
+        self.max_bytes = max_bytes
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.encoder_ms_saved = 0.0
+        self._encode_ms = None  # running average per image, to price a hit
+
+    def lookup(self, key: int):
+        """Embedding of the closest stored frame within the threshold, or None"""
+        with self._lock:
+            best, best_distance = None, self.threshold + 1
+            for stored in self._entries:
+                distance = bin(stored ^ key).count("1")
+                if distance < best_distance:
+                    best, best_distance = stored, distance
+                    if not distance:
+                        break
+            if best is None:
+                self.misses += 1
+                embedding, saved = None, 0.0
+            else:
+                self._entries.move_to_end(best)
+                self.hits += 1
+                embedding, saved = self._entries[best], self._encode_ms or 0.0
+                self.encoder_ms_saved += saved
+
+        if embedding is None:
+            metrics.incr("vision_cache_misses")
+        else:
+            metrics.incr("vision_cache_hits")
+            metrics.incr("vision_encoder_ms_saved", saved)
+        return embedding
+
+    def store(self, key: int, embedding, encode_ms: float):
+        size = getattr(embedding, "nbytes", 0)
+        with self._lock:
+            self._encode_ms = encode_ms if self._encode_ms is None else 0.8 * self._encode_ms + 0.2 * encode_ms
+            if size > self.max_bytes:
+                return
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.nbytes -= getattr(previous, "nbytes", 0)
+            self._entries[key] = embedding
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.nbytes -= getattr(evicted, "nbytes", 0)
+                self.evictions += 1
+        metrics.observe("vision_encoder_ms", encode_ms)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "threshold_bits": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "encoder_ms_saved": round(self.encoder_ms_saved, 1)
+            }
+
+
+def install_vision_cache(model, cache: VisionEmbeddingCache) -> bool:
+    """Route the model's image-feature path through `cache`, one image at a time.
+
+    Wraps `model.get_image_features(pixel_values, ...)` on the instance; a
+    batch is split per image so a multi-camera prompt can mix hits and misses.
+    Returns False if this model has no such hook. Installing again (a model
+    re-activated from the registry) replaces the previous cache.
+    """
+    original = getattr(model, "_uncached_image_features", None) or getattr(model, "get_image_features", None)
+    if original is None:
+        return False
+    import mlx.core as mx
+
+    def cached_image_features(pixel_values, *args, **kwargs):
+        if pixel_values is None or pixel_values.ndim != 4:
+            return original(pixel_values, *args, **kwargs)
+
+        images = np.array(pixel_values.astype(mx.float32))
+        keys = [perceptual_hash(image) for image in images]
+        features: list = [cache.lookup(key) for key in keys]
+        for i, key in enumerate(keys):
+            if features[i] is not None:
+                continue
+            start = time.perf_counter()
+            embedding = original(pixel_values[i:i + 1], *args, **kwargs)
+            mx.eval(embedding)
+            cache.store(key, embedding, (time.perf_counter() - start) * 1000)
+            features[i] = embedding
+        return features[0] if len(features) == 1 else mx.concatenate(features, axis=0)
+
+    model._uncached_image_features = original
+    model.get_image_features = cached_image_features
+    return True
+
+
+def create_vision_cache(model, max_mb: float, threshold: int) -> Optional[VisionEmbeddingCache]:
+    if max_mb <= 0:
+        return None
+    cache = VisionEmbeddingCache(int(max_mb * 1024 * 1024), threshold)
+    return cache if install_vision_cache(model, cache) else None
@@ -0,0 +1,380 @@
+# app/vlm_generation.py
+import copy
+import time
+from typing import Iterator, List, Optional, Tuple
+
+from PIL import Image
+
+
+def fork_prompt_cache(prompt_cache: list) -> list:
+    """Copy-on-write copy of a prompt cache.
+
+    Each layer's keys/values are re-bound to views trimmed to the cached
+    length. The first update on the fork has no spare room, so the cache
+    allocates fresh buffers and the shared arrays are never written.
+    """
+    forked = []
+    for layer in prompt_cache:
+        clone = copy.copy(layer)
+        state = layer.state
+        if state and state[0] is not None:
+            clone.state = state
+        if hasattr(layer, "meta_state"):
+            clone.meta_state = layer.meta_state
+        forked.append(clone)
+    return forked
+
+
+def prompt_cache_nbytes(prompt_cache: list) -> int:
+    total = 0
+    for layer in prompt_cache:
+        for array in (layer.state or ()):
+            total += getattr(array, "nbytes", 0)
+    return total
+
+
+class PrefixCache:
+    """KV state for a fixed token prefix, prefilled once and forked per request"""
+
+    def __init__(self, tokens: List[int], prompt_cache: list, prefill_ms: float):
+        self.tokens = tokens
+        self.prompt_cache = prompt_cache
+        self.prefill_ms = prefill_ms
+        self.nbytes = prompt_cache_nbytes(prompt_cache)
+        self.hits = 0
+
+    def match(self, input_ids) -> int:
+        """Number of leading tokens covered by this prefix (0 if the prompt doesn't start with it)"""
+        n = len(self.tokens)
+        if input_ids.shape[1] <= n:
+            return 0
+        return n if input_ids[0, :n].tolist() == self.tokens else 0
+
+    def fork(self) -> list:
+        self.hits += 1
+        return fork_prompt_cache(self.prompt_cache)
+
+
+class VLMGenerator:
+    """Token-level generation over mlx_vlm internals.
+
+    Mirrors mlx_vlm's stream_generate but prepares inputs itself, so a
+    request can start from a forked prompt cache and only prefill the
+    tokens after the cached prefix.
+    """
+
+    def __init__(self, model, processor, config: dict):
+        import mlx.core as mx
+        try:
+            from mlx_vlm.generate import generate_step
+        except ImportError:
+            from mlx_vlm.utils import generate_step
+        from mlx_vlm.utils import prepare_inputs
+
+        self.mx = mx
+        self.model = model
+        self.processor = processor
+        self.config = config
+        self._generate_step = generate_step
+        self._prepare_inputs = prepare_inputs
+        self.tokenizer = processor.tokenizer if hasattr(processor, "tokenizer") else processor
+        self.image_token_index = getattr(model.config, "image_token_index", None)
+        self.eos_token_ids = self._find_eos_ids()
+        pad = getattr(self.tokenizer, "pad_token_id", None)
+        self.pad_token_id = pad if isinstance(pad, int) else 0
+
+    def _find_eos_ids(self) -> set:
+        ids = set()
+        for source in (self.config.get("eos_token_id"), getattr(self.tokenizer, "eos_token_id", None),
+                       getattr(self.tokenizer, "eos_token_ids", None)):
+            if isinstance(source, int):
+                ids.add(source)
+            elif source:
+                ids.update(int(i) for i in source)
+        # Gemma ends a turn with <end_of_turn>
+        end_of_turn = self.tokenizer.convert_tokens_to_ids("<end_of_turn>") if hasattr(self.tokenizer, "convert_tokens_to_ids") else None
+        if isinstance(end_of_turn, int) and end_of_turn >= 0:
+            ids.add(end_of_turn)
+        return ids
+
+    def _render(self, messages: List[dict]) -> str:
+        template_owner = self.processor if hasattr(self.processor, "apply_chat_template") else self.tokenizer
+        return template_owner.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+    def format_prompt(self, parts: List[dict], history: Optional[List[Tuple[str, str]]] = None) -> str:
+        """Render a user turn from ordered content parts ({"type": "text"/"image"}),
+        after text-only (user, reply) turns of `history`"""
+        messages = []
+        for user_text, reply in history or ():
+            messages.append({"role": "user", "content": [{"type": "text", "text": user_text}]})
+            messages.append({"role": "assistant", "content": [{"type": "text", "text": reply}]})
+        messages.append({"role": "user", "content": parts})
+        return self._render(messages)
+
+    def format_continuation(self, parts: List[dict]) -> str:
+        """Template text that follows a model reply: end of that turn, a new user turn, generation prompt"""
+        marker = "<<reply>>"
+        text = self._render([
+            {"role": "user", "content": [{"type": "text", "text": "-"}]},
+            {"role": "assistant", "content": [{"type": "text", "text": marker}]},
+            {"role": "user", "content": parts}
+        ])
+        return text[text.index(marker) + len(marker):]
+
+    def prepare(self, prompt: str, images: List[Image.Image]) -> dict:
+        inputs = self._prepare_inputs(
+            self.processor,
+            images=images or None,
+            prompts=prompt,
+            image_token_index=self.image_token_index
+        )
+        return dict(inputs)
+
+    def new_detokenizer(self):
+        detokenizer = copy.copy(self.processor.detokenizer)
+        detokenizer.reset()
+        return detokenizer
+
+    def make_cache(self) -> list:
+        try:
+            from mlx_vlm.models import cache as cache_utils
+            return cache_utils.make_prompt_cache(self.model.language_model)
+        except (ImportError, AttributeError):
+            return self.model.language_model.make_cache()
+
+    def build_prefix(self, prompt: str, images: List[Image.Image]) -> Optional[PrefixCache]:
+        """Prefill everything before the first image token of `prompt` and keep its KV state"""
+        inputs = self.prepare(prompt, images)
+        ids = inputs["input_ids"][0].tolist()
+        cut = ids.index(self.image_token_index) if self.image_token_index in ids else len(ids) - 1
+        if cut <= 0:
+            return None
+
+        start = time.perf_counter()
+        prompt_cache = self.make_cache()
+        prefix_ids = inputs["input_ids"][:, :cut]
+        self.model(prefix_ids, None, cache=prompt_cache)
+        self.mx.eval([layer.state for layer in prompt_cache])
+        prefill_ms = (time.perf_counter() - start) * 1000
+        return PrefixCache(ids[:cut], prompt_cache, prefill_ms)
+
+    def _split_inputs(self, inputs: dict, skip: int) -> tuple:
+        """Drop the first `skip` positions from every sequence-aligned input"""
+        input_ids = inputs.pop("input_ids")
+        pixel_values = inputs.pop("pixel_values", None)
+        mask = inputs.pop("attention_mask", None)
+        length = input_ids.shape[1]
+        if skip:
+            input_ids = input_ids[:, skip:]
+            if mask is not None:
+                mask = mask[:, skip:]
+            for key, value in list(inputs.items()):
+                if hasattr(value, "shape") and len(value.shape) >= 2 and value.shape[1] == length:
+                    inputs[key] = value[:, skip:]
+        return input_ids, pixel_values, mask, inputs
+
+    def stream(self, prompt: str, images: List[Image.Image], max_tokens: int = 50, temperature: float = 0.7,
+               prefix: Optional[PrefixCache] = None, stats: Optional[dict] = None, session=None) -> Iterator[str]:
+        """Yield the text segment of every generated token (possibly empty).
+
+        With a warm `session`, `prompt` is only the continuation (see
+        format_continuation) and is prefilled on top of the session's cache;
+        afterwards the session holds the cache and tokens through this reply.
+        """
+        stats = stats if stats is not None else {}
+        inputs = self.prepare(prompt, images)
+        new_ids = inputs["input_ids"][0].tolist()
+
+        if session is not None and session.warm:
+            # The continuation is tokenized on its own: drop its BOS, and the
+            # <end_of_turn> the cache already holds if the last reply ended on it
+            skip = 0
+            bos = getattr(self.tokenizer, "bos_token_id", None)
+            if new_ids and new_ids[0] == bos:
+                skip += 1
+            if session.tokens and session.tokens[-1] in self.eos_token_ids and new_ids[skip:skip + 1] == session.tokens[-1:]:
+                skip += 1
+            prompt_cache = session.prompt_cache
+            reused = len(session.tokens)
+            known = session.tokens + new_ids[skip:]
+            stats["session_tokens_reused"] = reused
+        else:
+            skip = prefix.match(inputs["input_ids"]) if prefix else 0
+            reused = skip
+            if skip:
+                prompt_cache = prefix.fork()
+            else:
+                prompt_cache = self.make_cache() if session is not None else None
+            known = list(new_ids)
+            stats["prefix_tokens_reused"] = reused
+        stats["prompt_tokens"] = len(known)
+        input_ids, pixel_values, mask, extra = self._split_inputs(inputs, skip)
+
+        detokenizer = self.new_detokenizer()
+        start = time.perf_counter()
+        steps = self._generate_step(
+            input_ids, self.model, pixel_values, mask,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            prompt_cache=prompt_cache,
+            **extra
+        )
+        completed = False
+        try:
+            for n, (token, _) in enumerate(steps):
+                if n == 0:
+                    stats["prefill_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                token = token.item() if hasattr(token, "item") else int(token)
+                known.append(token)
+                if token in self.eos_token_ids:
+                    break
+                detokenizer.add_token(token)
+                yield detokenizer.last_segment
+            completed = True
+        except GeneratorExit:
+            # Consumer stopped between tokens (stop policy, abort): the cache is still consistent
+            completed = True
+            raise
+        finally:
+            steps.close()
+            if session is not None:
+                self._commit_session(session, known, prompt_cache, completed)
+        detokenizer.finalize()
+        if detokenizer.last_segment:
+            yield detokenizer.last_segment
+
+    def _commit_session(self, session, known: List[int], prompt_cache: list, completed: bool):
+        """Line the cache up with the tokens known to be in it and hand both to the session"""
+        length = self._cache_length(prompt_cache)
+        if not completed or length == 0:
+            # Aborted mid-prefill/decode: the cache state is unknown
+            session.drop_cache()
+            return
+        if length < len(known):
+            known = known[:length]
+        elif length > len(known):
+            # generate_step runs one token ahead; roll the cache back to what was seen
+            excess = length - len(known)
+            if not all(getattr(layer, "is_trimmable", lambda: False)() for layer in prompt_cache):
+                session.drop_cache()
+                return
+            for layer in prompt_cache:
+                layer.trim(excess)
+        session.commit(known, prompt_cache)
+
+    # Batched generation. Prompts are left-padded to a common length so every
+    # row's next token sits in the last column; pad positions are masked out,
+    # and since RoPE only sees relative positions the shift doesn't change them.
+
+    def max_batch_context(self) -> Optional[int]:
+        """Longest padded prompt + decode a batch can hold (smallest sliding window), None if unbounded"""
+        text_config = getattr(self.model.config, "text_config", None)
+        window = getattr(text_config, "sliding_window", None) if text_config else None
+        return window or None
+
+    def prefill_batch(self, prompts: List[str], images: List[List[Image.Image]]) -> tuple:
+        """Prefill several prompts as one left-padded batch.
+
+        Returns (last-position logits [B, vocab], prompt cache, pad per row,
+        prompt token ids per row).
+        """
+        mx = self.mx
+        prepared = [self.prepare(prompt, row_images) for prompt, row_images in zip(prompts, images)]
+        prompt_ids = [p["input_ids"][0].tolist() for p in prepared]
+        lengths = [len(ids) for ids in prompt_ids]
+        width = max(lengths)
+        pads = [width - n for n in lengths]
+
+        def left_pad(array, pad, value):
+            if not pad:
+                return array
+            filler = mx.full((array.shape[0], pad) + tuple(array.shape[2:]), value, dtype=array.dtype)
+            return mx.concatenate([filler, array], axis=1)
+
+        input_ids = mx.concatenate([left_pad(p["input_ids"], pad, self.pad_token_id)
+                                    for p, pad in zip(prepared, pads)], axis=0)
+        mask = self._prefill_mask(width, pads)
+        pixel_values = [p["pixel_values"] for p in prepared if p.get("pixel_values") is not None]
+        pixel_values = mx.concatenate(pixel_values, axis=0) if pixel_values else None
+
+        extra = {}
+        for key, value in prepared[0].items():
+            if key in ("input_ids", "pixel_values", "attention_mask"):
+                continue
+            if hasattr(value, "shape") and len(value.shape) >= 2 and value.shape[1] == lengths[0]:
+                extra[key] = mx.concatenate([left_pad(p[key], pad, 0) for p, pad in zip(prepared, pads)], axis=0)
+
+        prompt_cache = self.make_cache()
+        outputs = self.model(input_ids, pixel_values, mask=mask, cache=prompt_cache, **extra)
+        logits = getattr(outputs, "logits", outputs)[:, -1, :]
+        mx.eval(logits)
+        return logits, prompt_cache, pads, prompt_ids
+
+    def _prefill_mask(self, width: int, pads: List[int]):
+        """Additive [B, 1, L, L] attention mask: causal, within the sliding window, pad keys hidden.
+
+        A non-None mask replaces the model's own causal/sliding-window masks,
+        so it has to carry all three. Pad queries still see themselves, which
+        keeps their (never attended) rows finite instead of NaN.
+        """
+        mx = self.mx
+        positions = mx.arange(width)
+        query, key = positions[:, None], positions[None, :]
+        visible = key <= query
+        window = self.max_batch_context()
+        if window:
+            visible = visible & (query - key < window)
+        real = key[None] >= mx.array(pads)[:, None, None]
+        visible = visible[None] & (real | (key == query)[None])
+        return mx.where(visible, 0.0, float("-inf"))[:, None, :, :]
+
+    def decode_batch(self, tokens, prompt_cache: list, pads: List[int]):
+        """One decode step for every row; returns next-token logits [B, vocab]"""
+        mx = self.mx
+        key_length = self._cache_length(prompt_cache) + 1
+        positions = mx.arange(key_length)[None, :]
+        masked = positions < mx.array(pads)[:, None]
+        mask = mx.where(masked, float("-inf"), 0.0)[:, None, None, :]
+        outputs = self.model.language_model(tokens[:, None], cache=prompt_cache, mask=mask)
+        logits = getattr(outputs, "logits", outputs)[:, -1, :]
+        mx.eval(logits)
+        return logits
+
+    def sample(self, logits, temperatures: List[float]):
+        """Per-row sampling: greedy where the temperature is 0"""
+        mx = self.mx
+        temps = mx.array(temperatures)
+        greedy = mx.argmax(logits, axis=-1)
+        sampled = mx.random.categorical(logits / mx.maximum(temps, 1e-5)[:, None])
+        return mx.where(temps == 0, greedy, sampled)
+
+    @staticmethod
+    def _cache_length(prompt_cache: list) -> int:
+        return max(getattr(layer, "offset", 0) for layer in prompt_cache)
+
+    def commit_row(self, session, known: List[int], prompt_cache: list, row: int, pad: int):
+        """Seed a cold session from one row of a batch cache, its left padding cut off.
+
+        Batches only hold prompts shorter than the sliding window (see
+        max_batch_context), so no rotating layer has wrapped yet and every
+        layer's positions can be shifted down by `pad`.
+        """
+        single = []
+        for layer in prompt_cache:
+            clone = copy.copy(layer)
+            state = layer.state
+            if state and state[0] is not None:
+                clone.state = tuple(array[row:row + 1, :, pad:, :] for array in state)
+            for attr in ("offset", "_idx"):
+                if hasattr(layer, attr):
+                    setattr(clone, attr, getattr(layer, attr) - pad)
+            single.append(clone)
+        self._commit_session(session, known, single, completed=True)
+
+    def select_rows(self, prompt_cache: list, rows: List[int]):
+        """Keep only `rows` of every layer's batch, once finished requests leave the batch"""
+        index = self.mx.array(rows)
+        for layer in prompt_cache:
+            state = layer.state
+            if state and state[0] is not None:
+                layer.state = tuple(array[index] for array in state)
@@ -0,0 +1,84 @@
+# benchmarks/bench_batching.py
+"""Aggregate generation throughput with 1..N concurrent requests (needs MLX).
+
+Greedy output of every batched request is checked against the same
+question run on its own, so a broken batch mask shows up as a mismatch.
+
+Run from the backend directory:
+    python benchmarks/bench_batching.py --concurrency 1,2,4 --max-tokens 48
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+QUESTIONS = [
+    "Which component on this board looks damaged?",
+    "What tool do I need to remove this connector?",
+    "Is the solder joint on the left cold?",
+    "Where should I measure the supply voltage?",
+]
+
+
+IMAGE = Image.new("RGB", (640, 480), (90, 120, 90))
+
+
+def generate(service, question: str, max_tokens: int, stats: dict) -> str:
+    prompt = service.build_repair_prompt(question, 1)
+    return "".join(service._vlm_token_iterator(prompt, [IMAGE], max_tokens, temperature=0.0, stats=stats))
+
+
+def run_round(service, concurrency: int, max_tokens: int, reference=None):
+    results = [None] * concurrency
+    texts = [None] * concurrency
+
+    def worker(slot):
+        stats = {}
+        texts[slot] = generate(service, QUESTIONS[slot % len(QUESTIONS)], max_tokens, stats)
+        results[slot] = stats
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    tokens = sum(r.get("generated_tokens", 0) for r in results)
+    for slot, (stats, text) in enumerate(zip(results, texts)):
+        expected = reference[slot % len(QUESTIONS)] if reference else None
+        if expected is not None and stats.get("batch_size", 1) > 1 and text != expected:
+            print(f"  batched output differs (request {slot}):\n    single:  {expected!r}\n    batched: {text!r}")
+    return tokens / elapsed, max(r.get("batch_size", 1) for r in results), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,2,4")
+    parser.add_argument("--max-tokens", type=int, default=48)
+    args = parser.parse_args()
+
+    from app.mlx_service import get_mlx_service
+
+    service = get_mlx_service()
+    run_round(service, 1, 4)  # warm-up
+    # One request at a time never batches: the single-sequence output to compare against
+    reference = [generate(service, question, args.max_tokens, {}) for question in QUESTIONS]
+
+    baseline = None
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        tps, batch, elapsed = run_round(service, concurrency, args.max_tokens, reference)
+        baseline = baseline or tps
+        print(f"  {concurrency:2d} concurrent: {tps:6.1f} tok/s aggregate ({tps / baseline:.2f}x), "
+              f"batch {batch}, wall {elapsed:.2f}s")
+    print(f"Scheduler: {service.scheduler.stats()}")
+    service.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# benchmarks/bench_capture.py
+"""Headless camera-path benchmarks on a synthetic frame source.
+
+Run from the backend directory:
+    python benchmarks/bench_capture.py --source "pattern://?size=1280x720&fps=30"
+    python benchmarks/bench_capture.py --vlm          # also times a VLM turn (needs MLX)
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return f"p50={pick(0.5) * 1000:.2f}ms p95={pick(0.95) * 1000:.2f}ms max={samples[-1] * 1000:.2f}ms"
+
+
+def bench_acquisition(stream, iterations: int):
+    latest, fresh = [], []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        stream.get_frame()
+        latest.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        stream.get_frame(newer_than=time.time())
+        fresh.append(time.perf_counter() - start)
+    print(f"  latest frame        {percentiles(latest)}")
+    print(f"  frame newer than now {percentiles(fresh)}")
+
+
+def bench_fanout(stream, clients: int, seconds: float, quality: int):
+    counts = [0] * clients
+    stop = threading.Event()
+
+    def client(slot):
+        subscriber = stream.subscribe(maxsize=1)
+        try:
+            while not stop.is_set():
+                frame = subscriber.get(timeout=0.5)
+                if frame is not None:
+                    stream.encode_jpeg(frame, quality=quality)
+                    counts[slot] += 1
+        finally:
+            subscriber.close()
+
+    encodes_before = stream.jpeg_cache.encodes
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    per_client = [c / seconds for c in counts]
+    encodes = stream.jpeg_cache.encodes - encodes_before
+    print(f"  {clients:2d} clients: {statistics.mean(per_client):5.1f} fps/client "
+          f"(min {min(per_client):.1f}), {encodes / seconds:.1f} encodes/s")
+
+
+def bench_vlm(iterations: int):
+    from app.mlx_service import get_mlx_service
+
+    service = get_mlx_service()
+    for i in range(iterations):
+        start = time.perf_counter()
+        image = service.capture_current_frame()
+        captured = time.perf_counter()
+        service.process_image_chat(image, "What is on the bench?", max_tokens=30)
+        done = time.perf_counter()
+        print(f"  turn {i}: capture {(captured - start) * 1000:.1f}ms, generate {(done - captured) * 1000:.0f}ms")
+    service.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default="pattern://?size=1280x720&fps=30", help="frame source spec for camera 0")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=3.0, help="duration of each fan-out run")
+    parser.add_argument("--clients", default="1,2,4,8", help="subscriber counts for the fan-out run")
+    parser.add_argument("--quality", type=int, default=80)
+    parser.add_argument("--vlm", action="store_true", help="also time capture + generation through MLXService")
+    args = parser.parse_args()
+
+    # Camera 0 and the "ai" role both resolve to the synthetic source
+    os.environ["CAMERA_SOURCE_0"] = args.source
+    os.environ["CAMERA_SOURCE_1"] = args.source
+
+    from app.camera_manager import get_camera_manager
+
+    manager = get_camera_manager()
+    stream = manager.get(0)
+    if stream is None:
+        sys.exit(f"Could not open source {args.source!r}")
+    stream.get_frame(timeout=5.0)
+
+    print(f"Source: {stream.source.describe()}")
+    print("Frame acquisition:")
+    bench_acquisition(stream, args.iterations)
+    print("MJPEG fan-out:")
+    for clients in (int(c) for c in args.clients.split(",")):
+        bench_fanout(stream, clients, args.seconds, args.quality)
+    print(f"Stats: {stream.stats()}")
+
+    if args.vlm:
+        print("VLM path:")
+        bench_vlm(3)
+    manager.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# benchmarks/bench_prefill.py
+"""Prefill latency with and without the preamble prefix cache (needs MLX).
+
+Run from the backend directory:
+    python benchmarks/bench_prefill.py --iterations 5
+"""
+import argparse
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+
+def run(service, prompt, image, max_tokens, use_prefix_cache):
+    stats = {}
+    text = "".join(service._vlm_token_iterator(prompt, [image], max_tokens, temperature=0.0, stats=stats,
+                                               use_prefix_cache=use_prefix_cache))
+    return stats, text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--max-tokens", type=int, default=20)
+    parser.add_argument("--question", default="Which component on this board looks damaged?")
+    args = parser.parse_args()
+
+    os.environ["PREFIX_CACHE"] = "1"
+    from app.mlx_service import get_mlx_service
+
+    service = get_mlx_service()
+    if service.prefix_cache is None:
+        sys.exit("Prefix cache could not be built")
+    image = Image.new("RGB", (640, 480), (90, 120, 90))
+    prompt = service.build_repair_prompt(args.question, 1)
+
+    # Warm-up so neither side pays for kernel compilation
+    run(service, prompt, image, 2, False)
+    run(service, prompt, image, 2, True)
+
+    cold, warm = [], []
+    for _ in range(args.iterations):
+        stats, cold_text = run(service, prompt, image, args.max_tokens, False)
+        cold.append(stats["prefill_ms"])
+        stats, warm_text = run(service, prompt, image, args.max_tokens, True)
+        warm.append(stats["prefill_ms"])
+        reused, total = stats["prefix_tokens_reused"], stats["prompt_tokens"]
+        if warm_text != cold_text:
+            print(f"  output differs:\n    cold: {cold_text!r}\n    warm: {warm_text!r}")
+
+    print(f"Prefix: {reused}/{total} prompt tokens, {service.prefix_cache.nbytes / 1e6:.1f}MB")
+    print(f"  full prefill    median {statistics.median(cold):.0f}ms")
+    print(f"  from prefix     median {statistics.median(warm):.0f}ms")
+    print(f"  saved           {statistics.median(cold) - statistics.median(warm):.0f}ms per request")
+    service.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/bench_speculative.py
+"""A/B decode latency with and without speculative decoding (needs MLX and DRAFT_MODEL).
+
+Run from the backend directory:
+    DRAFT_MODEL=mlx-community/gemma-3-270m-it-4bit python benchmarks/bench_speculative.py
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+QUESTIONS = [
+    "Which component on this board looks damaged?",
+    "How do I desolder this capacitor safely?",
+    "What should I check first if the board does not power on?",
+]
+
+
+def run(service, prompt, image, max_tokens, temperature, speculative):
+    """(decode ms per token after the first, text, stats) for one generation"""
+    stats = {}
+    stamps, pieces = [], []
+    for text in service._vlm_token_iterator(prompt, [image], max_tokens, temperature, stats=stats,
+                                            use_prefix_cache=True, speculative=speculative):
+        stamps.append(time.perf_counter())
+        pieces.append(text)
+    per_token = (stamps[-1] - stamps[0]) * 1000 / (len(stamps) - 1) if len(stamps) > 1 else 0.0
+    return per_token, "".join(pieces), stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--temperature", type=float, default=0.0)
+    args = parser.parse_args()
+
+    from app.mlx_service import get_mlx_service
+
+    service = get_mlx_service()
+    if not service.scheduler.speculative:
+        sys.exit("No draft model loaded - set DRAFT_MODEL")
+    image = Image.new("RGB", (640, 480), (90, 120, 90))
+
+    timings = {False: [], True: []}
+    for question in QUESTIONS:
+        prompt = service.build_repair_prompt(question, 1)
+        run(service, prompt, image, 4, args.temperature, True)  # warm-up
+        for _ in range(args.iterations):
+            outputs = {}
+            for speculative in (False, True):
+                per_token, outputs[speculative], _ = run(service, prompt, image, args.max_tokens,
+                                                         args.temperature, speculative)
+                timings[speculative].append(per_token)
+            if args.temperature == 0 and outputs[False] != outputs[True]:
+                print(f"  greedy outputs differ for {question!r}")
+
+    standard, speculative = statistics.median(timings[False]), statistics.median(timings[True])
+    print(f"  standard     {standard:.1f} ms/token")
+    print(f"  speculative  {speculative:.1f} ms/token ({standard / speculative:.2f}x)")
+    print(f"Draft: {service.scheduler.speculative.stats()}")
+    service.cleanup()
+
+
+if __name__ == "__main__":
+    main()